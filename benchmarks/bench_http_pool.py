@@ -0,0 +1,95 @@
+# benchmarks/bench_http_pool.py ───────────────────────────────────────
+# 每則訊息開新的 httpx.AsyncClient vs 共用連線池，對本機 TLS stub server。
+# 每則訊息打 2 個請求（跟 nutrition_db.fetch_nutrition 一樣 search → information），
+# 看每則訊息省下多少握手時間、實際開了幾條連線。
+#   python benchmarks/bench_http_pool.py [訊息數]
+# 需要 openssl 產生自簽憑證。
+# ----------------------------------------------------------------------
+import asyncio, pathlib, ssl, subprocess, sys, tempfile, time
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import httpx
+import http_pool
+
+N    = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+BODY = b'{"results":[{"id":1}],"calories":{"value":100}}'
+
+
+class Stub:
+    """極簡 HTTP/1.1 keep-alive server，只回固定 JSON，順便數連線數。"""
+    def __init__(self):
+        self.connections = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                             b"content-length: %d\r\n\r\n%s" % (len(BODY), BODY))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def _certs(d: pathlib.Path) -> tuple[str, str]:
+    crt, key = d / "stub.crt", d / "stub.key"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                    "-keyout", key, "-out", crt, "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost"],
+                   check=True, capture_output=True)
+    return str(crt), str(key)
+
+
+async def _message(cli: httpx.AsyncClient, base: str):
+    r = await cli.get(f"{base}/food/ingredients/search", params={"query": "apple"})
+    r.raise_for_status()
+    r = await cli.get(f"{base}/food/ingredients/1/information", params={"amount": 100})
+    r.raise_for_status()
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        crt, key = _certs(pathlib.Path(tmp))
+        srv_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        srv_ctx.load_cert_chain(crt, key)
+        cli_ctx = ssl.create_default_context(cafile=crt)
+
+        stub   = Stub()
+        server = await asyncio.start_server(stub.handle, "127.0.0.1", 0, ssl=srv_ctx)
+        base   = f"https://localhost:{server.sockets[0].getsockname()[1]}"
+
+        # 舊寫法：每個請求一個 client
+        stub.connections = 0
+        t0 = time.perf_counter()
+        for _ in range(N):
+            for _ in range(2):
+                async with httpx.AsyncClient(verify=cli_ctx, timeout=10) as c:
+                    r = await c.get(f"{base}/x"); r.raise_for_status()
+        t_fresh, c_fresh = time.perf_counter() - t0, stub.connections
+
+        # 新寫法：http_pool 同樣的 timeout / limits，整個 app 共用一個 client
+        stub.connections = 0
+        pooled = httpx.AsyncClient(
+            verify=cli_ctx, timeout=http_pool.timeout(),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+        t0 = time.perf_counter()
+        for _ in range(N):
+            await _message(pooled, base)
+        t_pool, c_pool = time.perf_counter() - t0, stub.connections
+        await pooled.aclose()
+
+        server.close(); await server.wait_closed()
+
+    print(f"messages: {N}（每則 2 個請求）")
+    print(f"new client per call : {t_fresh / N * 1e3:7.2f} ms/msg   connections {c_fresh}")
+    print(f"shared pool         : {t_pool  / N * 1e3:7.2f} ms/msg   connections {c_pool}")
+    print(f"saved per message   : {(t_fresh - t_pool) / N * 1e3:7.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+# benchmarks/bench_lookup.py ──────────────────────────────────────────
+# 量 nutrition_db.lookup_food 在不同快取筆數下的延遲，確認是平的（O(1)）。
+# 查詢都是不重複的名字、每輪前清掉 norm_name 的 lru_cache，
+# 量到的是「正規化 + 查索引」，不會因為小表的查詢一直重複而被快取墊得比較快。
+# 大表還是會慢個 1µs 左右：dict 本身放不進 CPU cache（單純 d[key] 就從幾十 ns
+# 變幾百 ns），跟筆數成正比的話 500k 應該是 1k 的幾百倍。
+#   python benchmarks/bench_lookup.py
+# ----------------------------------------------------------------------
+import pathlib, random, string, sys, time
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import nutrition_db
+from textnorm import norm_name
+
+SIZES   = [1_000, 10_000, 100_000, 500_000]
+QUERIES = 20_000
+
+
+def _fake_names(n: int) -> list[str]:
+    rnd = random.Random(n)
+    return ["".join(rnd.choices(string.ascii_lowercase, k=12)) for _ in range(n)]
+
+
+def bench(n: int) -> float:
+    names = _fake_names(n)
+    nutrition_db.load()                  # 先讓它把 CSV 讀完，不然第一次查詢會蓋掉下面的索引
+    nutrition_db._rebuild_index([
+        {"name": nm, "kcal": 100.0, "protein": 1.0, "fat": 1.0, "carb": 1.0}
+        for nm in names
+    ])
+
+    rnd = random.Random(0)
+    qs  = [nm.upper() for nm in rnd.sample(names, min(QUERIES, n))]   # 故意大寫，走正規化
+    elapsed, done = 0.0, 0
+    while done < QUERIES:                # 小表不夠 QUERIES 個不同名字：同一批多跑幾輪
+        norm_name.cache_clear()
+        t0 = time.perf_counter()
+        for q in qs:
+            assert nutrition_db.lookup_food(q) is not None
+        elapsed += time.perf_counter() - t0
+        done += len(qs)
+    return elapsed / done * 1e6
+
+
+if __name__ == "__main__":
+    print(f"{'rows':>10} | {'µs / lookup':>12}")
+    for n in SIZES:
+        print(f"{n:>10,} | {bench(n):>12.2f}")
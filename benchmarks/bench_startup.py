@@ -0,0 +1,67 @@
+# benchmarks/bench_startup.py ─────────────────────────────────────────
+# 冷啟動：每一輪開新的 python process，量
+#   import main         → 模組載入（不該讀檔、不該 import pandas）
+#   lifespan 起來        → server 可以收 webhook
+#   /healthz ready       → 背景 warm-up 做完
+#   第一則回覆           → 一則文字訊息從 handle() 到 reply_text()
+# 查的是臨時 nutrition.col 裡的食物，不打 Spoonacular / LINE。
+#   python benchmarks/bench_startup.py [輪數]
+# ----------------------------------------------------------------------
+import json, os, pathlib, statistics, subprocess, sys, tempfile, time
+
+ROOT   = pathlib.Path(__file__).resolve().parents[1]
+ROUNDS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter()
+
+async def run():
+    replies = []
+    async def reply_text(token, text, **kw):    # 只記下來，不真的打 LINE
+        replies.append(time.perf_counter())
+    main.reply_text = reply_text
+
+    async with main.app.router.lifespan_context(main.app):
+        t_up = time.perf_counter()
+        event = type("E", (), {})()
+        event.message = type("M", (), {"type": "text", "text": "滷肉飯"})()
+        event.reply_token, event.timestamp = "bench", time.time() * 1000
+        await main.handle(event)
+        t_reply = replies[0]
+        while not main._warm["ready"] and not main._warm["error"]:
+            await asyncio.sleep(0.001)
+        t_ready = time.perf_counter()
+    print(json.dumps({"import": t_import - t0, "lifespan": t_up - t0,
+                      "first_reply": t_reply - t0, "ready": t_ready - t0,
+                      "pandas": "pandas" in sys.modules}))
+
+asyncio.run(run())
+"""
+
+
+def _one(env) -> dict:
+    t0  = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    res = json.loads(out.strip().splitlines()[-1])
+    res["process"] = time.perf_counter() - t0
+    return res
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(ROOT))
+    import colstore
+    with tempfile.TemporaryDirectory() as d:
+        col = pathlib.Path(d) / "bench.col"
+        colstore.build([{"name": "滷肉飯", "kcal": 520, "protein": 15, "fat": 20, "carb": 70}], col)
+        env = dict(os.environ, NUTRITION_COLSTORE=str(col), PHASH_FILE=str(pathlib.Path(d) / "h.json"),
+                   FOOD_REF_DIR=str(pathlib.Path(d) / "refs"))
+        runs = [_one(env) for _ in range(ROUNDS)]
+
+    print(f"{ROUNDS} 輪，中位數（ms，從 import 前起算）")
+    for k in ("import", "lifespan", "first_reply", "ready", "process"):
+        print(f"  {k:<12} {statistics.median(r[k] for r in runs) * 1e3:>8.1f}")
+    print("  pandas 有被 import：", any(r["pandas"] for r in runs))
@@ -0,0 +1,54 @@
+# benchmarks/bench_store.py ───────────────────────────────────────────
+# 10k 筆連續寫入：舊的 pd.concat + to_csv 整檔重寫 vs CsvStore append-only。
+#   python benchmarks/bench_store.py [筆數] [舊版只跑前幾筆]
+# 舊版是 O(n²)，預設只跑前 500 筆，避免等太久。
+# ----------------------------------------------------------------------
+import pathlib, sys, tempfile, time
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from nutrition_store import CsvStore, FIELDS
+
+N        = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+N_LEGACY = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+
+def _row(i: int) -> dict:
+    return {"name": f"food-{i}", "kcal": 100.0, "protein": 1.0, "fat": 1.0, "carb": 1.0}
+
+
+def bench_legacy(d: pathlib.Path, n: int) -> float:
+    import pandas as pd
+    csv = d / "legacy.csv"
+    df  = pd.DataFrame([_row(0)], columns=FIELDS)
+    t0  = time.perf_counter()
+    for i in range(1, n):
+        df = pd.concat([df, pd.DataFrame([_row(i)])], ignore_index=True)
+        df.to_csv(csv, index=False)
+    return time.perf_counter() - t0
+
+
+def bench_store(d: pathlib.Path, n: int) -> tuple[float, float]:
+    st = CsvStore(d / "store.csv", compact_every=max(n // 4, 1))
+    st.load()
+    t0 = time.perf_counter()
+    for i in range(n):
+        st.append(_row(i))
+    t_append = time.perf_counter() - t0        # 呼叫端（event loop）實際付出的時間
+    st.flush(timeout=60)
+    t_durable = time.perf_counter() - t0       # 全部 fsync 落地
+    st.close()
+    assert len(CsvStore(d / "store.csv").load()) == n
+    return t_append, t_durable
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        d = pathlib.Path(tmp)
+        t_leg = bench_legacy(d, N_LEGACY)
+        t_app, t_dur = bench_store(d, N)
+    print(f"legacy concat+to_csv : {N_LEGACY:>6,} rows  {t_leg:8.2f} s  "
+          f"({t_leg / N_LEGACY * 1e3:8.3f} ms/row, 越後面越慢)")
+    print(f"CsvStore.append      : {N:>6,} rows  {t_app:8.3f} s  "
+          f"({t_app / N * 1e6:8.2f} µs/row, 呼叫端)")
+    print(f"CsvStore durable     : {N:>6,} rows  {t_dur:8.3f} s  "
+          f"(含背景批次 fsync 與壓實)")
@@ -0,0 +1,59 @@
+# benchmarks/bench_triggers.py ────────────────────────────────────────
+# 5,000 條觸發規則：舊的逐條 re.search vs TriggerMatcher（AC + 合併正則）。
+#   python benchmarks/bench_triggers.py [規則數]
+# 規則 90% 是純關鍵字（FAQ / 貼圖），10% 是正則；訊息大多不命中（要去查營養）。
+# ----------------------------------------------------------------------
+import pathlib, random, re, sys, time
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from chat import TRIGGERS
+from trigger_matcher import TriggerMatcher
+
+N    = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+MSGS = 2_000
+CJK  = "雞腿便當珍珠奶茶牛肉麵滷肉飯蛋餅豆漿油條水餃鍋貼炒飯咖哩拉麵壽司"
+
+
+def _word(rnd: random.Random) -> str:
+    return "".join(rnd.choices(CJK, k=rnd.randint(3, 6)))
+
+
+def _table(rnd: random.Random) -> list[tuple[str, str]]:
+    table = list(TRIGGERS.items())
+    for i in range(N - len(table)):
+        w = _word(rnd)
+        p = w if rnd.random() < 0.9 else rf"^{w[:2]}.*{w[2:]}$"
+        table.append((p, f"reply-{i}"))
+    return table
+
+
+def _legacy(table, t):
+    for pattern, reply in table:
+        if re.search(pattern, t, flags=re.IGNORECASE):
+            return reply
+    return None
+
+
+if __name__ == "__main__":
+    rnd   = random.Random(0)
+    table = _table(rnd)
+    msgs  = [_word(rnd) + _word(rnd) for _ in range(MSGS)] + ["謝謝", "hello", "早安"]
+
+    t0 = time.perf_counter()
+    m  = TriggerMatcher(table)
+    t_build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    new = [m.match(x) for x in msgs]
+    t_new = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    old = [_legacy(table, x) for x in msgs]
+    t_old = time.perf_counter() - t0
+
+    assert new == old, "比對結果跟逐條 re.search 不一樣"
+    print(f"rules: {len(m):,}  messages: {len(msgs):,}  "
+          f"hits: {sum(x is not None for x in new)}")
+    print(f"compile           : {t_build * 1e3:8.1f} ms（載入 / 熱更新時一次）")
+    print(f"legacy re.search  : {t_old / len(msgs) * 1e6:8.1f} µs/msg")
+    print(f"TriggerMatcher    : {t_new / len(msgs) * 1e6:8.1f} µs/msg")
@@ -0,0 +1,320 @@
+# benchmarks/loadtest.py ──────────────────────────────────────────────
+# /callback 壓測：把 webhook 簽好名重播給真的 app（uvicorn 子 process），
+# LINE（reply / 圖片內容）和 Spoonacular 換成本機 stub，可以調延遲和錯誤率。
+# 量的是
+#   - /callback 的 HTTP 延遲（LINE 那邊看到的）
+#   - 端到端：webhook 送出 → stub 收到那則事件的 reply
+#   - 每秒處理幾個事件、上游各 endpoint 被打幾次
+#
+#   python benchmarks/loadtest.py                                  # 合成 2000 個事件
+#   python benchmarks/loadtest.py --events 5000 --rate 300 --spoon-latency 0.3 --spoon-error-rate 0.05
+#   python benchmarks/loadtest.py --input recorded.jsonl --keep-ids
+#   python benchmarks/loadtest.py --redeliver-rate 0.2        # 模擬 LINE 重送，看有沒有重複回覆
+#   python benchmarks/loadtest.py --hog-share 0.5             # 一個人送一半的事件，看別人有沒有被拖慢
+#
+# --input 每行是一個 webhook body（{"events": [...]}）或單一事件；
+# replyToken / timestamp 會改寫（--keep-ids 才保留 webhookEventId）。
+# ----------------------------------------------------------------------
+import argparse, asyncio, base64, collections, hashlib, hmac, json, os, pathlib, random
+import socket, subprocess, sys, tempfile, time, uuid
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+ROOT   = pathlib.Path(__file__).resolve().parents[1]
+SECRET = "loadtest-secret"
+IMAGE  = (ROOT / "bubbletea.jpg").read_bytes()
+HOG    = "U" + "f" * 32                 # --hog-share 那個狂丟訊息的人
+FOODS  = ["滷肉飯", "雞腿便當", "珍珠奶茶", "牛肉麵", "蚵仔煎", "鹹酥雞", "水餃", "蛋餅",
+          "chicken salad", "apple", "banana", "pizza", "ramen", "sushi", "bubble tea"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pct(xs: list[float], p: float) -> float:
+    if not xs:
+        return float("nan")
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+# ── stub：LINE + Spoonacular 共用一個 ASGI app ──────────────────────────
+class Stubs:
+    def __init__(self, args):
+        self.args   = args
+        self.calls  = collections.Counter()           # (服務, 路徑) → 次數
+        self.errors = collections.Counter()
+        self.replies: dict[str, float] = {}            # replyToken → 收到時間（第一次）
+        self.reply_count = collections.Counter()       # replyToken → 回了幾次
+        self.rnd    = random.Random(args.seed)
+        self.app    = self._build()
+
+    async def _delay(self, latency: float):
+        if latency > 0:
+            await asyncio.sleep(self.rnd.expovariate(1 / latency))   # 平均 latency 的指數分佈
+
+    def _fail(self, service: str, path: str, rate: float) -> Response | None:
+        if rate and self.rnd.random() < rate:
+            self.errors[(service, path)] += 1
+            return Response(status_code=500)
+        return None
+
+    def _build(self) -> FastAPI:
+        a, app = self.args, FastAPI()
+
+        @app.post("/v2/bot/message/reply")
+        async def reply(req: Request):
+            self.calls[("line", "reply")] += 1
+            await self._delay(a.line_latency)
+            if (r := self._fail("line", "reply", a.line_error_rate)):
+                return r
+            body = await req.json()
+            self.replies.setdefault(body["replyToken"], time.perf_counter())
+            self.reply_count[body["replyToken"]] += 1
+            return {"sentMessages": [{"id": str(i), "quoteToken": uuid.uuid4().hex}
+                                     for i, _ in enumerate(body.get("messages", []))]}
+
+        @app.get("/v2/bot/message/{mid}/content")
+        async def content(mid: str):
+            self.calls[("line", "content")] += 1
+            await self._delay(a.line_latency)
+            return self._fail("line", "content", a.line_error_rate) or \
+                Response(IMAGE, media_type="image/jpeg")
+
+        def nutrition(name: str) -> dict:
+            h = int(hashlib.md5(name.encode()).hexdigest()[:6], 16)
+            return {"calories": {"value": 100 + h % 700}, "protein": {"value": h % 40},
+                    "fat": {"value": h % 30}, "carbs": {"value": h % 90}}
+
+        async def spoon(path: str):
+            self.calls[("spoonacular", path)] += 1
+            await self._delay(a.spoon_latency)
+            return self._fail("spoonacular", path, a.spoon_error_rate)
+
+        quota = {"x-api-quota-left": "10000", "x-api-quota-used": "1"}
+
+        @app.get("/recipes/guessNutrition")
+        async def guess(title: str = ""):
+            if (r := await spoon("guessNutrition")):
+                return r
+            return Response(json.dumps(nutrition(title)), media_type="application/json", headers=quota)
+
+        @app.post("/recipes/parseIngredients")
+        async def parse(req: Request):
+            if (r := await spoon("parseIngredients")):
+                return r
+            lines = (await req.form())["ingredientList"].splitlines()
+            out = [{"id": i + 1, "original": l, "nutrition": {"nutrients": [
+                       {"name": "Calories", "amount": nutrition(l)["calories"]["value"]},
+                       {"name": "Protein", "amount": 5}, {"name": "Fat", "amount": 5},
+                       {"name": "Carbohydrates", "amount": 20}]}} for i, l in enumerate(lines)]
+            return Response(json.dumps(out), media_type="application/json", headers=quota)
+
+        @app.post("/food/images/analyze")
+        async def analyze():
+            if (r := await spoon("images/analyze")):
+                return r
+            return Response(json.dumps({"category": {"name": "bubble_tea", "probability": 0.9}}),
+                            media_type="application/json", headers=quota)
+
+        return app
+
+
+# ── webhook 產生 / 重播 ────────────────────────────────────────────────
+def _synthetic(args) -> list[dict]:
+    rnd = random.Random(args.seed)
+    pool = [f"{rnd.choice(FOODS)}{i}" if i >= len(FOODS) else FOODS[i] for i in range(args.distinct)]
+    events = []
+    for i in range(args.events):
+        if rnd.random() < args.image_ratio:
+            msg = {"type": "image", "id": str(10_000_000 + i), "quoteToken": f"q{i}",
+                   "contentProvider": {"type": "line"}}
+        else:
+            # 偏斜分佈：少數熱門食物被問很多次（快取才有意義）
+            msg = {"type": "text", "id": str(i), "quoteToken": f"q{i}",
+                   "text": pool[min(int(rnd.paretovariate(1.2)) - 1, len(pool) - 1)]}
+        events.append({"type": "message", "mode": "active", "message": msg,
+                       "source": {"type": "user", "userId": HOG if rnd.random() < args.hog_share
+                                  else f"U{rnd.randrange(args.users):032x}"},
+                       "deliveryContext": {"isRedelivery": False}})
+    return events
+
+
+def _recorded(path: pathlib.Path) -> list[dict]:
+    events = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            obj = json.loads(line)
+            events.extend(obj["events"] if "events" in obj else [obj])
+    return events
+
+
+def _batches(events: list[dict], size: int):
+    for i in range(0, len(events), size):
+        yield events[i:i + size]
+
+
+def _sign(body: bytes) -> str:
+    return base64.b64encode(hmac.new(SECRET.encode(), body, hashlib.sha256).digest()).decode()
+
+
+async def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60):
+    async with httpx.AsyncClient() as c:
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < timeout:
+            if proc.poll() is not None:
+                raise SystemExit("app 起不來，看上面的 log")
+            try:
+                if (await c.get(url + "/healthz")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise SystemExit("等 /healthz ready 逾時")
+
+
+async def main(args):
+    stubs = Stubs(args)
+    stub_port, app_port = _free_port(), _free_port()
+    stub = uvicorn.Server(uvicorn.Config(stubs.app, host="127.0.0.1", port=stub_port,
+                                         log_level="warning", lifespan="off"))
+    stub_task = asyncio.create_task(stub.serve())
+
+    tmp = tempfile.TemporaryDirectory()
+    d   = pathlib.Path(tmp.name)
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    env = dict(os.environ,
+               LINE_CHANNEL_SECRET=SECRET, LINE_CHANNEL_ACCESS_TOKEN="loadtest",
+               LINE_API_HOST=stub_url, LINE_DATA_HOST=stub_url,
+               SPOONACULAR_BASE=stub_url, SPOONACULAR_API_KEY="loadtest",
+               NUTRITION_CSV=str(d / "nutrition.csv"), NUTRITION_COLSTORE=str(d / "none.col"),
+               PHASH_FILE=str(d / "hashes.json"), INTAKE_DIR=str(d / "intake"),
+               WEBHOOK_DEDUPE_SQLITE=str(d / "webhook_seen.sqlite3"),
+               FOOD_REF_DIR=str(d / "refs"), SPOON_RPS=str(args.spoon_rps),
+               SPOON_BURST=str(max(1, int(args.spoon_rps))))
+    env.update(dict(kv.split("=", 1) for kv in args.env))
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                             "--port", str(app_port), "--workers", str(args.workers),
+                             "--log-level", "warning", "--no-access-log"], cwd=ROOT, env=env)
+    app_url = f"http://127.0.0.1:{app_port}"
+    try:
+        await _wait_ready(app_url, proc)
+        events = _recorded(args.input) if args.input else _synthetic(args)
+        sent: dict[str, float] = {}
+        hog_tokens: set[str] = set()
+        cb_lat: list[float] = []
+        cb_status = collections.Counter()
+
+        redelivered = 0
+        rnd = random.Random(args.seed + 1)
+
+        async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=64)) as c:
+            async def post(batch, redelivery=False):
+                if redelivery:                 # LINE 重送：同一個 webhookEventId / replyToken
+                    await asyncio.sleep(rnd.expovariate(1 / args.redeliver_delay))
+                    batch = [dict(ev, deliveryContext={"isRedelivery": True}) for ev in batch]
+                else:
+                    now_ms = int(time.time() * 1000)
+                    for ev in batch:
+                        ev["replyToken"] = uuid.uuid4().hex
+                        ev["timestamp"] = now_ms
+                        if not args.keep_ids or "webhookEventId" not in ev:
+                            ev["webhookEventId"] = uuid.uuid4().hex.upper()
+                body = json.dumps({"destination": "Ubench", "events": batch}).encode()
+                t0 = time.perf_counter()
+                if not redelivery:
+                    for ev in batch:
+                        sent[ev["replyToken"]] = t0
+                        if ev.get("source", {}).get("userId") == HOG:
+                            hog_tokens.add(ev["replyToken"])
+                r = await c.post(app_url + "/callback", content=body,
+                                 headers={"X-Line-Signature": _sign(body),
+                                          "Content-Type": "application/json"})
+                cb_lat.append(time.perf_counter() - t0)
+                cb_status[r.status_code] += 1
+
+            # 開環：照固定速率送，不等前一批回來（跟 LINE 一樣）
+            t_start, tasks = time.perf_counter(), []
+            interval = args.batch / args.rate
+            for i, batch in enumerate(_batches(events, args.batch)):
+                delay = t_start + i * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(post(batch)))
+                if rnd.random() < args.redeliver_rate:
+                    tasks.append(asyncio.create_task(post(batch, redelivery=True)))
+                    redelivered += len(batch)
+            await asyncio.gather(*tasks)
+            t_sent = time.perf_counter()
+
+            # 等 reply 收齊（或 drain 秒數到）
+            while len(stubs.replies) < len(sent) and time.perf_counter() - t_sent < args.drain:
+                await asyncio.sleep(0.05)
+            t_end = max(stubs.replies.values(), default=t_sent)
+            stats = (await c.get(app_url + "/stats")).json() if args.workers == 1 else None
+
+        e2e = [stubs.replies[t] - sent[t] for t in sent if t in stubs.replies]
+        wall = t_end - t_start
+        print(f"事件 {len(sent)}（{args.batch} 個 / webhook，目標 {args.rate:g}/s），"
+              f"回覆 {len(e2e)}，沒回 {len(sent) - len(e2e)}")
+        print(f"throughput       {len(e2e) / wall:8.1f} events/s（{wall:.1f}s）")
+        for name, xs in (("/callback", cb_lat), ("端到端", e2e)):
+            print(f"{name:<10} ms   p50 {_pct(xs, 50) * 1e3:8.1f}   p95 {_pct(xs, 95) * 1e3:8.1f}"
+                  f"   p99 {_pct(xs, 99) * 1e3:8.1f}   max {max(xs, default=0) * 1e3:8.1f}")
+        if hog_tokens:
+            for name, toks in (("其他人", sent.keys() - hog_tokens), ("狂丟的人", hog_tokens)):
+                xs = [stubs.replies[t] - sent[t] for t in toks if t in stubs.replies]
+                print(f"{name:<8} ms   p50 {_pct(xs, 50) * 1e3:8.1f}   p95 {_pct(xs, 95) * 1e3:8.1f}"
+                      f"   回覆 {len(xs)}/{len(toks)}")
+        print("/callback 狀態   ", dict(cb_status))
+        if redelivered:
+            dup = sum(n - 1 for n in stubs.reply_count.values() if n > 1)
+            print(f"重送 {redelivered} 個事件，重複回覆 {dup}")
+        print("上游呼叫：")
+        for (svc, path), n in sorted(stubs.calls.items()):
+            err = stubs.errors[(svc, path)]
+            print(f"  {svc:<12} {path:<18} {n:>7}" + (f"  （注入錯誤 {err}）" if err else ""))
+        if stats:
+            print("queue", {k: stats["queue"][k] for k in ("shed", "processed", "errors", "wait_ms_max")})
+            print("dedupe", {k: stats["dedupe"][k] for k in ("duplicates", "shared_duplicates", "redeliveries")})
+            print("users ", {k: stats["users"][k] for k in ("allowed", "limited", "users")},
+                  "shed_per_user", stats["queue"]["shed_per_key"])
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        stub.should_exit = True
+        await stub_task
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="/callback 壓測（本機 LINE / Spoonacular stub）")
+    ap.add_argument("--input", type=pathlib.Path, help="錄下來的 webhook JSONL；沒給就合成")
+    ap.add_argument("--keep-ids", action="store_true", help="保留輸入裡的 webhookEventId")
+    ap.add_argument("--events", type=int, default=2000)
+    ap.add_argument("--distinct", type=int, default=200, help="合成時有幾種不同的食物")
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--hog-share", type=float, default=0.0, help="幾成的事件來自同一個人")
+    ap.add_argument("--image-ratio", type=float, default=0.05)
+    ap.add_argument("--rate", type=float, default=200, help="每秒送幾個事件")
+    ap.add_argument("--batch", type=int, default=1, help="每個 webhook 帶幾個事件")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker 數")
+    ap.add_argument("--line-latency", type=float, default=0.03, help="秒，平均")
+    ap.add_argument("--line-error-rate", type=float, default=0.0)
+    ap.add_argument("--spoon-latency", type=float, default=0.15, help="秒，平均")
+    ap.add_argument("--spoon-error-rate", type=float, default=0.0)
+    ap.add_argument("--spoon-rps", type=float, default=50, help="app 端的 Spoonacular 限速")
+    ap.add_argument("--redeliver-rate", type=float, default=0.0, help="幾成的 webhook 會被重送一次")
+    ap.add_argument("--redeliver-delay", type=float, default=1.0, help="重送平均晚幾秒")
+    ap.add_argument("--drain", type=float, default=30, help="送完後最多等回覆幾秒")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--env", action="append", default=[], metavar="K=V", help="額外傳給 app 的環境變數")
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,48 @@
+# cache.py ────────────────────────────────────────────────────────────
+# 行程內的 LRU + TTL 快取（L1）。也能存「查不到」(None)，TTL 短一點，
+# 讓同一個亂打的字不會一直去燒 Spoonacular 額度。
+# ----------------------------------------------------------------------
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+MISS = object()                 # get() 沒命中時回這個；None 是「確定查不到」
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 2048, ttl: float = 3600, negative_ttl: float = 300):
+        self.maxsize      = maxsize
+        self.ttl          = ttl
+        self.negative_ttl = negative_ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0,
+                      "evictions": 0, "expired": 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.stats["misses"] += 1
+            return MISS
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            self.stats["expired"] += 1
+            self.stats["misses"]  += 1
+            return MISS
+        self._data.move_to_end(key)
+        self.stats["negative_hits" if value is None else "hits"] += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        ttl = self.negative_ttl if value is None else self.ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, size=len(self._data), maxsize=self.maxsize)
@@ -2,9 +2,11 @@
 # 只做「關鍵字 → 回覆」與「排版營養結果」，完全不碰網路或 GPT。
 # ----------------------------------------------------------------------
 
-import re
+import json, os, pathlib, re, time
 from typing import Final, Dict
 
+from trigger_matcher import TriggerMatcher
+
 TRIGGERS: Final[Dict[str, str]] = {
     # ── 打招呼 ───────────────────────────────────────────────────────
     r"^(hi|hello)$":          "Hello! 😊  想查食物營養嗎？傳文字或照片給我吧！",
@@ -18,16 +20,59 @@ TRIGGERS: Final[Dict[str, str]] = {
 }
 
 
+# ── 外部觸發表（FAQ、貼圖回覆…）──────────────────────────────────
+# triggers.json（或 TRIGGERS_FILE 指定的檔）：{"正則": "回覆", ...}，照檔案順序，
+# 排在上面 TRIGGERS 之後。改檔不用重開，最多 TRIGGERS_RELOAD 秒內生效。
+TRIGGERS_FILE   = pathlib.Path(os.getenv("TRIGGERS_FILE",
+                               pathlib.Path(__file__).with_name("triggers.json")))
+TRIGGERS_RELOAD = float(os.getenv("TRIGGERS_RELOAD", "2"))
+
+_matcher: TriggerMatcher | None = None
+_mtime   = None
+_checked = 0.0
+
+
+def _load_table() -> list[tuple[str, str]]:
+    table = list(TRIGGERS.items())
+    if TRIGGERS_FILE.exists():
+        try:
+            extra = json.loads(TRIGGERS_FILE.read_text(encoding="utf-8"))
+            table += [(str(p), str(r)) for p, r in extra.items()]
+        except (OSError, ValueError, AttributeError) as e:
+            print("[triggers] 讀取失敗，沿用舊表：", e)
+            raise
+    return table
+
+
+def _get_matcher() -> TriggerMatcher:
+    """第一次用到才編譯；之後每 TRIGGERS_RELOAD 秒看一次檔案有沒有改。"""
+    global _matcher, _mtime, _checked
+    now = time.monotonic()
+    if _matcher is not None and now - _checked < TRIGGERS_RELOAD:
+        return _matcher
+    _checked = now
+    try:
+        mtime = TRIGGERS_FILE.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    if _matcher is None or mtime != _mtime:
+        try:
+            _matcher = TriggerMatcher(_load_table())
+            _mtime   = mtime
+        except (OSError, ValueError, AttributeError, re.error):
+            if _matcher is None:             # 第一次就壞掉：只用內建表
+                _matcher = TriggerMatcher(list(TRIGGERS.items()))
+            _mtime = mtime                   # 同一個壞檔不要一直重讀
+    return _matcher
+
+
 def try_reply(text: str) -> str | None:
     """
     命中任一 TRIGGERS 就回覆；否則回 None 讓主程式去查營養。
     比對時一律轉小寫、去空白；正則用 IGNORECASE 。
+    所有規則編成一個比對器（見 trigger_matcher.py），順位跟表的順序一樣。
     """
-    t = text.strip().lower()
-    for pattern, reply in TRIGGERS.items():
-        if re.search(pattern, t, flags=re.IGNORECASE):
-            return reply
-    return None
+    return _get_matcher().match(text.strip().lower())
 
 
 # ── 以下是排版營養資訊 ────────────────────────────────────────────────
@@ -72,8 +117,28 @@ def advice_by_calories(kcal: int) -> str:
     return "熱量偏高，建議搭配蔬菜或分次食用！"
 
 
+def format_meal(info: dict) -> str:
+    """一餐多樣：每樣一行，最後給總計"""
+    lines = [f"{info['name']} 估算營養："]
+    for it in info["items"]:
+        qty = f" ×{it['qty']:g}" if it["qty"] != 1 else ""
+        if it.get("missing"):
+            lines.append(f"・{it['name']}{qty}：查不到 QQ")
+        else:
+            lines.append(f"・{it['name']}{qty}：{it['calories']:g} kcal "
+                         f"（蛋白質 {it['protein']:g} g | 脂肪 {it['fat']:g} g | 碳水 {it['carbs']:g} g）")
+    lines += [
+        f"總計 熱量 {info['calories']:g} kcal",
+        f"蛋白質 {info['protein']:g} g | 脂肪 {info['fat']:g} g | 碳水 {info['carbs']:g} g",
+        advice_by_calories(info["calories"]),
+    ]
+    return "\n".join(lines)
+
+
 def format_nutrition(info: dict) -> str:
     """把 Spoonacular 回傳的營養資訊排版成 Line 訊息"""
+    if info.get("items"):
+        return format_meal(info)
     return (
         f"{info['name']} 估算營養：\n"
         f"熱量 {info['calories']} kcal\n"
@@ -83,6 +148,30 @@ def format_nutrition(info: dict) -> str:
         f"{advice_by_calories(info['calories'])}"
     )
 
+
+# ── 今日累計（見 intake.py）──────────────────────────────────────────
+_INTAKE_QUERY = re.compile(r"^(今天|今日)我?(總共|一共)?(吃了?(多少|什麼|啥)|的?總?(熱量|卡路里))"
+                           r"[?？!！。~～]*$|^(總計|累計)$")
+
+
+def is_intake_query(text: str) -> bool:
+    """「今天吃了多少」「今日熱量」這類問句。"""
+    return bool(_INTAKE_QUERY.search(text.strip()))
+
+
+def format_intake(tot: dict | None) -> str:
+    if not tot:
+        return "今天還沒有紀錄喔～傳食物名稱或照片給我，我幫你記！"
+    lines = [f"今天記了 {tot['count']} 筆："]
+    lines += [f"・{name} {kcal:g} kcal" for name, kcal in tot["items"]]
+    if tot["count"] > len(tot["items"]):
+        lines.append(f"（只列最後 {len(tot['items'])} 筆）")
+    lines += [
+        f"總計 熱量 {tot['calories']:g} kcal",
+        f"蛋白質 {tot['protein']:g} g | 脂肪 {tot['fat']:g} g | 碳水 {tot['carbs']:g} g",
+    ]
+    return "\n".join(lines)
+
 #=========================================
 # chat.py
 # ────────────────────────────────────────────────
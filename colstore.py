@@ -0,0 +1,221 @@
+# colstore.py ─────────────────────────────────────────────────────────
+# 唯讀、欄式、mmap 的營養表（nutrition.col），給大張的離線食物表用。
+#   - kcal / protein / fat / carb 各一條 float32 陣列
+#   - 顯示名稱去重後存一次（interned），每列只記名稱編號
+#   - 正規化後的 key 排好序，查詢用二分搜尋，不用先建 dict
+# 開檔只是 mmap，不解析、不配置物件，啟動幾乎不花時間；
+# 多個 worker 開同一個檔共用 OS 的 page cache。
+#
+# 從 nutrition.csv 轉檔：
+#   python colstore.py nutrition.csv nutrition.col
+# ----------------------------------------------------------------------
+import argparse, array, csv, mmap, os, pathlib, struct, sys
+
+from textnorm import norm_name
+
+MAGIC   = b"NUTCOL1\0"
+COLUMNS = ("kcal", "protein", "fat", "carb")
+# magic, 列數, 名稱數, key 數, 保留
+_HEADER = struct.Struct("<8sIIII")
+
+assert array.array("I").itemsize == 4 and array.array("f").itemsize == 4
+assert sys.byteorder == "little"          # 檔案直接 mmap 成 native 陣列
+
+
+def _u32(values) -> bytes:
+    return array.array("I", values).tobytes()
+
+
+def _blob(strings: list[str]) -> tuple[bytes, list[int]]:
+    """字串接成一塊 UTF-8，回 (blob, 每個字串的起點 + 結尾)。"""
+    parts, offs, pos = [], [0], 0
+    for s in strings:
+        b = s.encode("utf-8")
+        parts.append(b)
+        pos += len(b)
+        offs.append(pos)
+    return b"".join(parts), offs
+
+
+def build(rows, path: pathlib.Path) -> int:
+    """
+    rows：dict（name / kcal / protein / fat / carb，可以先帶好正規化的 key）的 iterable。
+    同一個正規化名稱只收第一筆（跟 nutrition_db 的索引一樣）；回寫了幾列。
+    先寫 .tmp 再 os.replace，正在 mmap 舊檔的 worker 不受影響。
+    """
+    cols = {c: array.array("f") for c in COLUMNS}
+    name_ids = array.array("I")
+    names: dict[str, int] = {}
+    keys:  dict[str, int] = {}
+    for r in rows:
+        key = r.get("key") or norm_name(r["name"])
+        if not key or key in keys:
+            continue
+        keys[key] = len(name_ids)
+        name_ids.append(names.setdefault(r["name"], len(names)))
+        for c in COLUMNS:
+            try:
+                cols[c].append(float(r.get(c) or 0))
+            except ValueError:
+                cols[c].append(0.0)
+
+    n = len(name_ids)
+    name_blob, name_offs = _blob(list(names))                 # dict 保留插入順序 = 編號
+    sorted_keys = sorted(keys, key=lambda k: k.encode("utf-8"))
+    key_blob, key_offs = _blob(sorted_keys)
+
+    path = pathlib.Path(path)
+    tmp  = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fp:
+        fp.write(_HEADER.pack(MAGIC, n, len(names), len(keys), 0))
+        for c in COLUMNS:
+            fp.write(cols[c].tobytes())
+        fp.write(name_ids.tobytes())
+        fp.write(_u32(name_offs))
+        fp.write(_u32(key_offs))
+        fp.write(_u32(keys[k] for k in sorted_keys))
+        fp.write(name_blob)
+        fp.write(key_blob)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, path)
+    return n
+
+
+class ColStore:
+    """唯讀查詢；key 要先用 norm_name 正規化（get() 會幫你做）。"""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        with open(self.path, "rb") as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        mv = self._mv = memoryview(self._mm)
+        if len(mv) < _HEADER.size:
+            raise self._corrupt("太短，不是 nutrition colstore 檔")
+        magic, n, n_names, n_keys, _ = _HEADER.unpack_from(mv)
+        if magic != MAGIC:
+            raise self._corrupt("不是 nutrition colstore 檔")
+        # 檔案被截斷（寫到一半、磁碟滿）就在這裡擋掉，不要等到查詢才 IndexError
+        if len(mv) < _HEADER.size + 4 * ((len(COLUMNS) + 1) * n + n_names + 2 * n_keys + 2):
+            raise self._corrupt("不完整（被截斷了？）")
+
+        pos = _HEADER.size
+        def take(count: int, fmt: str):
+            nonlocal pos
+            view = mv[pos:pos + count * 4].cast(fmt)
+            pos += count * 4
+            return view
+        self._cols     = {c: take(n, "f") for c in COLUMNS}
+        self._name_ids = take(n, "I")
+        self._name_off = take(n_names + 1, "I")
+        self._key_off  = take(n_keys + 1, "I")
+        self._key_row  = take(n_keys, "I")
+        if len(mv) < pos + self._name_off[n_names] + self._key_off[n_keys]:
+            raise self._corrupt("不完整（被截斷了？）")
+        self._name_blob = mv[pos:pos + self._name_off[n_names]]
+        pos += self._name_off[n_names]
+        self._key_blob  = mv[pos:pos + self._key_off[n_keys]]
+        self._n_keys = n_keys
+
+    def _corrupt(self, why: str) -> ValueError:
+        self.close()
+        return ValueError(f"{self.path} {why}")
+
+    def __len__(self):
+        return self._n_keys
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key.encode("utf-8")) is not None
+
+    def _key(self, i: int) -> bytes:
+        return bytes(self._key_blob[self._key_off[i]:self._key_off[i + 1]])
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self._n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, key: bytes) -> int | None:
+        lo = self._lower_bound(key)
+        if lo < self._n_keys and self._key(lo) == key:
+            return self._key_row[lo]
+        return None
+
+    def _name(self, i: int) -> str:
+        nid = self._name_ids[i]
+        return bytes(self._name_blob[self._name_off[nid]:self._name_off[nid + 1]]).decode("utf-8")
+
+    def row(self, i: int) -> dict:
+        kcal, protein, fat, carb = (round(self._cols[c][i], 2) for c in COLUMNS)
+        return dict(name=self._name(i), calories=kcal, protein=protein, fat=fat, carbs=carb)
+
+    def prefix(self, key: str, limit: int, scan: int = 64) -> list[str]:
+        """
+        正規化 key 開頭的名稱（不含 key 本身）：二分搜尋到起點往後掃最多 scan 個，
+        挑最短的 limit 個。不用另外建索引。
+        """
+        p = key.encode("utf-8")
+        i, keys = self._lower_bound(p), []
+        while i < self._n_keys and len(keys) < scan and (k := self._key(i)).startswith(p):
+            if k != p:
+                keys.append((len(k), self._key_row[i]))
+            i += 1
+        return [self._name(r) for _, r in sorted(keys)[:limit]]
+
+    def get_key(self, key: str) -> dict | None:
+        """key 已經正規化過。"""
+        i = self._find(key.encode("utf-8"))
+        return None if i is None else self.row(i)
+
+    def get(self, name: str) -> dict | None:
+        return self.get_key(norm_name(name)) if name else None
+
+    def close(self):
+        for attr in ("_cols", "_name_ids", "_name_off", "_key_off", "_key_row",
+                     "_name_blob", "_key_blob"):
+            v = getattr(self, attr, None)
+            for view in (v.values() if isinstance(v, dict) else [v]):
+                if view is not None:
+                    view.release()
+        self._mv.release()
+        self._mm.close()
+
+
+def open_if_exists(path: pathlib.Path) -> ColStore | None:
+    """沒有檔就 None；檔案壞了（空檔、截斷、不是 colstore）也 None，印一行就好，不擋啟動。"""
+    try:
+        return ColStore(path)
+    except FileNotFoundError:
+        return None
+    except (ValueError, OSError) as e:
+        print("[colstore] 開不了，先不用：", type(e).__name__, e, flush=True)
+        return None
+
+
+def _read_csv(path: pathlib.Path):
+    """nutrition.csv 的欄位（kcal / carb）；Spoonacular 命名（calories / carbs）也吃。"""
+    with open(path, newline="", encoding="utf-8") as fp:
+        for r in csv.DictReader(fp):
+            yield {"name": r.get("name", ""),
+                   "kcal": r.get("kcal", r.get("calories")),
+                   "protein": r.get("protein"), "fat": r.get("fat"),
+                   "carb": r.get("carb", r.get("carbs"))}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="nutrition.csv → 欄式 mmap 檔")
+    ap.add_argument("src", type=pathlib.Path, help="CSV（name,kcal,protein,fat,carb）")
+    ap.add_argument("dst", type=pathlib.Path, nargs="?", help="輸出檔（預設同名 .col）")
+    args = ap.parse_args(argv)
+    dst = args.dst or args.src.with_suffix(".col")
+    n = build(_read_csv(args.src), dst)
+    print(f"{dst}：{n} 列、{dst.stat().st_size / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
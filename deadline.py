@@ -0,0 +1,74 @@
+# deadline.py ─────────────────────────────────────────────────────────
+# 每個 LINE 事件一個截止時間，順著 contextvar 傳到每一段（下載、分類、查營養）。
+# LINE 的 reply token 有時效，時間到了才算出來的答案也回不去，
+# 所以每段只拿「剩下的」預算：http_pool.timeout() 會自動夾到剩餘時間，
+# handler 用 within() 包住整段查詢，超時就改回快取 / 部分結果。
+#
+#   with deadline.scope(EVENT_BUDGET, started_at=event.timestamp / 1000):
+#       info = await deadline.within(classify_and_lookup(text=msg))
+# ----------------------------------------------------------------------
+import asyncio, contextlib, contextvars, math, time
+
+# 存 time.monotonic() 的截止點；沒設就是不限時（例如 benchmark、CLI）
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """這個事件的時間預算用完了。"""
+
+
+@contextlib.contextmanager
+def scope(budget: float, started_at: float | None = None):
+    """
+    設定截止時間 = 事件發生時間 + budget。
+    started_at 是 epoch 秒（LINE event.timestamp / 1000），
+    在 queue 裡等的時間也算進去；沒給就從現在算。
+    """
+    age = max(0.0, time.time() - started_at) if started_at else 0.0
+    token = _deadline.set(time.monotonic() + budget - age)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def detach():
+    """
+    在背景 task 裡呼叫：這個 task 之後不受事件的截止時間限制
+    （task 建立時複製了 context，改這裡不影響原本的事件）。
+    """
+    _deadline.set(None)
+
+
+def remaining() -> float:
+    """還剩幾秒；沒設截止時間回 inf，已經過了回 0。"""
+    if (d := _deadline.get()) is None:
+        return math.inf
+    return max(0.0, d - time.monotonic())
+
+
+def expired() -> bool:
+    return remaining() <= 0
+
+
+def clamp(seconds: float) -> float:
+    """某一段原本的 timeout 跟剩餘時間取小的；時間已經到了就直接丟例外。"""
+    left = remaining()
+    if left <= 0:
+        raise DeadlineExceeded
+    return min(seconds, left)
+
+
+async def within(aw):
+    """在剩餘時間內等 aw 做完，來不及就取消並丟 DeadlineExceeded。"""
+    left = remaining()
+    if left == math.inf:
+        return await aw
+    if left <= 0:
+        if asyncio.iscoroutine(aw):
+            aw.close()                      # 不會被 await 了，收掉免得噴警告
+        raise DeadlineExceeded
+    try:
+        return await asyncio.wait_for(aw, left)
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded from e
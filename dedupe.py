@@ -0,0 +1,137 @@
+# dedupe.py ───────────────────────────────────────────────────────────
+# LINE 在 /callback 慢的時候會重送事件（deliveryContext.isRedelivery），
+# 同一則訊息被處理兩次就是兩次 Spoonacular、兩次回覆。
+# 這裡記最近 WEBHOOK_DEDUPE_TTL 秒看過的 webhookEventId，重複的在進 queue 前就丟掉。
+#   - 本機：照到期時間排的 OrderedDict，最多 WEBHOOK_DEDUPE_MAX 筆，檢查 O(1)
+#   - 多 worker（NUTRITION_STORE=sqlite）：再到共用的 SQLite 搶一次 id，
+#     搶到的那個 worker 才處理；本機已經看過的不用再問 SQLite
+#   - 共用的那份壞了就放行（寧可多處理一次，也不要把訊息吃掉）
+# ----------------------------------------------------------------------
+import asyncio, os, pathlib, threading, time
+from collections import OrderedDict
+
+TTL     = float(os.getenv("WEBHOOK_DEDUPE_TTL", "3600"))
+MAXSIZE = int(os.getenv("WEBHOOK_DEDUPE_MAX", "100000"))
+SQLITE  = pathlib.Path(os.getenv("WEBHOOK_DEDUPE_SQLITE",
+                                 pathlib.Path(__file__).with_name("webhook_seen.sqlite3")))
+
+
+class _SharedSeen:
+    """跨 process 的 seen-set；id 到期前只有第一個 claim 的人拿到 True。"""
+
+    def __init__(self, path: pathlib.Path, ttl: float, vacuum_every: int = 512):
+        self.path, self.ttl, self.vacuum_every = pathlib.Path(path), ttl, vacuum_every
+        self._db = None
+        self._lock = threading.Lock()
+        self._claims = 0
+
+    def _connect(self):
+        import sqlite3
+        db = sqlite3.connect(self.path, timeout=2, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, expires REAL NOT NULL)")
+        return db
+
+    def claim(self, ids: list[str]) -> list[bool]:
+        """一個 transaction 搶一批；id 不存在或已過期才算搶到。在 thread 裡跑。"""
+        now = time.time()                    # 跨 process 要比，只能用牆上時間
+        with self._lock:
+            if self._db is None:
+                self._db = self._connect()
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                won = [db.execute(
+                           "INSERT INTO seen(id, expires) VALUES (?, ?) "
+                           "ON CONFLICT(id) DO UPDATE SET expires = excluded.expires "
+                           "WHERE seen.expires < ?", (i, now + self.ttl, now)).rowcount == 1
+                       for i in ids]
+                self._claims += len(ids)
+                if self._claims >= self.vacuum_every:    # 偶爾清一次過期的
+                    db.execute("DELETE FROM seen WHERE expires < ?", (now,))
+                    self._claims = 0
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return won
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class SeenSet:
+    def __init__(self, *, ttl: float = TTL, maxsize: int = MAXSIZE,
+                 shared: pathlib.Path | None = None):
+        self.ttl, self.maxsize = ttl, maxsize
+        # id → 到期時間；TTL 固定，所以插入順序就是到期順序，從頭清就好
+        self._local: OrderedDict[str, float] = OrderedDict()
+        self._shared = _SharedSeen(shared, ttl) if shared else None
+        self.stats = {"checked": 0, "duplicates": 0, "shared_duplicates": 0,
+                      "redeliveries": 0, "evictions": 0, "shared_errors": 0}
+
+    def _expire(self, now: float):
+        d = self._local
+        while d and next(iter(d.values())) <= now:
+            d.popitem(last=False)
+
+    async def first_seen(self, ids: list[str | None]) -> list[bool]:
+        """
+        每個 id 是不是第一次看到（TTL 內）。沒有 id 的一律當第一次。
+        同一批裡重複的 id 也只有第一個算。
+        """
+        now = time.monotonic()
+        self._expire(now)
+        fresh, ask = [], []
+        for n, i in enumerate(ids):
+            self.stats["checked"] += 1
+            if i is None:
+                fresh.append(True)
+            elif i in self._local:
+                self.stats["duplicates"] += 1
+                fresh.append(False)
+            else:
+                self._local[i] = now + self.ttl
+                if len(self._local) > self.maxsize:     # 滿了就丟最舊的
+                    self._local.popitem(last=False)
+                    self.stats["evictions"] += 1
+                fresh.append(True)
+                ask.append(n)
+
+        if self._shared and ask:
+            try:
+                won = await asyncio.to_thread(self._shared.claim, [ids[n] for n in ask])
+            except Exception as e:
+                self.stats["shared_errors"] += 1
+                print("[dedupe] 共用 seen-set 失敗，先放行", type(e).__name__, e, flush=True)
+            else:
+                for n, ok in zip(ask, won):
+                    if not ok:               # 別的 worker 已經在處理
+                        fresh[n] = False
+                        self.stats["duplicates"] += 1
+                        self.stats["shared_duplicates"] += 1
+        return fresh
+
+    async def drop_duplicates(self, events: list) -> list:
+        """WebhookParser 解析出來的事件 → 去掉看過的（照 webhook_event_id）。"""
+        for e in events:
+            if getattr(getattr(e, "delivery_context", None), "is_redelivery", False):
+                self.stats["redeliveries"] += 1
+        keep = await self.first_seen([getattr(e, "webhook_event_id", None) for e in events])
+        return [e for e, k in zip(events, keep) if k]
+
+    def close(self):
+        if self._shared:
+            self._shared.close()
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, size=len(self._local), maxsize=self.maxsize, ttl=self.ttl,
+                    shared=str(self._shared.path) if self._shared else None)
+
+
+# 多 worker 時（跟 nutrition_db 一樣看 NUTRITION_STORE）才開共用的 SQLite
+seen = SeenSet(shared=SQLITE if os.getenv("NUTRITION_STORE", "csv") == "sqlite" else None)
@@ -0,0 +1,138 @@
+# dispatcher.py ───────────────────────────────────────────────────────
+# /callback 只驗簽、把事件丟進有上限的 queue 就回 200，
+# 真正的處理（查營養、回 LINE）交給固定數量的 worker 慢慢消化。
+# queue 滿了就丟掉新事件（shed），不讓 webhook 卡到 LINE 逾時重送。
+#
+# 公平排程：給了 key（例如 LINE userId）就每個 key 一條小 queue，
+# worker 輪流從每條拿一個（round-robin），一個人連丟 50 張照片
+# 也只是排在自己那條後面，不會把其他人擠到後面去；
+# 每條最多 max_per_key 個，超過丟的是那個人自己的事件；有給 on_overflow
+# 就另外跑它（例如回一句「查太快了」），不佔 worker，同時最多 workers 個。
+# ----------------------------------------------------------------------
+import asyncio, heapq, time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class Dispatcher:
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], *,
+                 workers: int = 8, maxsize: int = 256,
+                 key: Callable[[Any], Hashable] | None = None,
+                 max_per_key: int | None = None,
+                 on_overflow: Callable[[Any], Awaitable[None]] | None = None):
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.key     = key or (lambda item: None)
+        self.max_per_key = max_per_key or maxsize
+        self.on_overflow = on_overflow
+        self._overflow: set[asyncio.Task] = set()
+        self._lanes: dict[Hashable, deque] = {}     # key → [(進 queue 時間, item), ...]
+        self._ring: deque[Hashable] = deque()       # 有事件在等的 key，輪到誰
+        self._depth = 0
+        self._ready: asyncio.Semaphore | None = None
+        self._idle:  asyncio.Event | None = None
+        self._unfinished = 0
+        self._tasks: list[asyncio.Task] = []
+        self.stats = {"enqueued": 0, "shed": 0, "shed_per_key": 0, "processed": 0, "errors": 0,
+                      "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    # ── 生命週期（FastAPI lifespan 呼叫）──────────────────────────
+    async def start(self):
+        self._ready = asyncio.Semaphore(0)
+        self._idle  = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"event-worker-{i}")
+                       for i in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10):
+        """關機前盡量把 queue 裡的事件做完，逾時就直接收掉。"""
+        if self._ready is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            print("[queue] 關機時還有", self._depth, "個事件沒處理")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, *self._overflow, return_exceptions=True)
+        self._tasks = []
+
+    # ── 進 queue ───────────────────────────────────────────────────
+    def submit(self, item: Any) -> bool:
+        """不等待；queue 滿了（或這個 key 那條滿了）回 False（事件被丟掉）。"""
+        k = self.key(item)
+        lane = self._lanes.get(k)
+        if self._depth >= self.maxsize:
+            self.stats["shed"] += 1
+            print("[queue] 滿了，丟掉事件", flush=True)
+            return False
+        if lane is not None and len(lane) >= self.max_per_key:
+            self.stats["shed_per_key"] += 1
+            if self.on_overflow and len(self._overflow) < self.workers:
+                t = asyncio.create_task(self._run_overflow(item))
+                self._overflow.add(t)
+                t.add_done_callback(self._overflow.discard)
+            return False
+        if lane is None:
+            lane = self._lanes[k] = deque()
+            self._ring.append(k)
+        lane.append((time.monotonic(), item))
+        self._depth += 1
+        self._unfinished += 1
+        self._idle.clear()
+        self._ready.release()
+        self.stats["enqueued"] += 1
+        return True
+
+    def _next(self) -> tuple[float, Any]:
+        """輪到的 key 拿一個；那條還有就排回 ring 尾巴，空了就收掉。"""
+        k = self._ring.popleft()
+        lane = self._lanes[k]
+        t_in, item = lane.popleft()
+        if lane:
+            self._ring.append(k)
+        else:
+            del self._lanes[k]
+        self._depth -= 1
+        return t_in, item
+
+    async def _run_overflow(self, item: Any):
+        try:
+            await self.on_overflow(item)
+        except Exception as e:
+            print("[queue] overflow handler", type(e).__name__, e, flush=True)
+
+    # ── worker ─────────────────────────────────────────────────────
+    async def _worker(self):
+        while True:
+            await self._ready.acquire()
+            t_in, item = self._next()
+            wait_ms = (time.monotonic() - t_in) * 1e3
+            self.stats["wait_ms_total"] += wait_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], wait_ms)
+            try:
+                await self.handler(item)
+                self.stats["processed"] += 1
+            except Exception as e:             # 一個事件壞掉不能把 worker 弄死
+                self.stats["errors"] += 1
+                print("[worker]", type(e).__name__, e, flush=True)
+            finally:
+                self._unfinished -= 1
+                if not self._unfinished:
+                    self._idle.set()
+
+    def queued(self, key: Hashable) -> int:
+        lane = self._lanes.get(key)
+        return len(lane) if lane else 0
+
+    def snapshot(self, top: int = 5) -> dict:
+        done = self.stats["processed"] + self.stats["errors"]
+        busiest = heapq.nlargest(top, self._lanes.items(), key=lambda kv: len(kv[1]))
+        return dict(self.stats,
+                    depth   = self._depth,
+                    maxsize = self.maxsize,
+                    workers = self.workers,
+                    lanes   = len(self._lanes),
+                    busiest_lanes = {str(k): len(v) for k, v in busiest},
+                    wait_ms_avg = self.stats["wait_ms_total"] / done if done else 0.0)
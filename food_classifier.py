@@ -105,7 +105,7 @@
 
 #======================================
 # food_classifier.py
-import os, asyncio, pandas as pd, httpx, pathlib
+import os, asyncio, httpx, pathlib
 
 BASE = "https://api.spoonacular.com"
 CSV  = pathlib.Path(__file__).with_name("nutrition_db.csv")  # 你的離線資料表
@@ -139,9 +139,13 @@ async def _guess_nutrition(name: str) -> dict | None:
     }
 
 # ── 離線 CSV 快速查找 ─────────────────────────────────────
-_df = pd.read_csv(CSV) if CSV.exists() else pd.DataFrame()
+_df = None                                # 第一次查才載 pandas / 讀檔，import 不拖慢
 
 def _lookup_local(name: str) -> dict | None:
+    global _df
+    if _df is None:
+        import pandas as pd
+        _df = pd.read_csv(CSV) if CSV.exists() else pd.DataFrame()
     row = _df.loc[_df["name"].str.lower() == name.lower()]
     if row.empty:
         return None
@@ -179,25 +183,32 @@ async def classify_and_lookup(*, text: str | None = None,
 * 文字：/recipes/guessNutrition?title=<food name>
 * 圖片：/food/images/analyze  → 再把識別出的名稱丟到 guessNutrition
 """
-import os, httpx, asyncio, tempfile, base64
+import os, httpx, asyncio, tempfile, base64, math, pathlib
+import deadline, http_pool, image_prep, metrics, nutrition_db
+from ratelimit    import spoonacular, users, UpstreamUnavailable, UserLimited, IMAGE_COST
+from cache        import TTLCache, MISS
+from image_hash   import PhashIndex, dhash
+from local_classifier import KnnClassifier
+from meal         import parse_meal, is_meal
+from singleflight import SingleFlight
+from textnorm     import norm_name
 
 API_KEY = os.getenv("SPOONACULAR_API_KEY", "")
-BASE    = "https://api.spoonacular.com"
+BASE    = os.getenv("SPOONACULAR_BASE", "https://api.spoonacular.com")   # 壓測時指到本機 stub
 
 async def _get_json(url: str, **params):
     params["apiKey"] = API_KEY
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.get(url, params=params)
+    r = await spoonacular.request("GET", url, params=params, timeout=http_pool.timeout(15))
     r.raise_for_status()
     return r.json()
 
-async def _post_image(image_path: str):
+async def _post_image(image: bytes, mime: str = "image/jpeg"):
+    """圖片直接從記憶體上傳，不落地、不在 event loop 上開檔"""
     url = f"{BASE}/food/images/analyze"
     params = {"apiKey": API_KEY}
-    with open(image_path, "rb") as fp:
-        files = {"file": fp}
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(url, params=params, files=files)
+    files = {"file": ("image", image, mime)}
+    r = await spoonacular.request("POST", url, params=params, files=files,
+                                  user_cost=IMAGE_COST, timeout=http_pool.timeout(30))
     r.raise_for_status()
     return r.json()
 
@@ -213,18 +224,237 @@ async def _guess_nutrition(name: str):
         "carbs"    : round(data["carbs"]["value"], 1),
     }
 
+# 同一道菜（正規化後同 key）同時只打一次 guessNutrition；
+# 合併了幾次看 _flights.stats["coalesced"]
+_flights = SingleFlight()
+
+async def _guess_nutrition_once(name: str):
+    # 每個呼叫者加入 flight 前各扣自己的額度；flight 本身不算誰的，
+    # 不然第一個人被限流，跟著等同一道菜的其他人也一起收到 UserLimited
+    spoonacular.charge_user(f"{BASE}/recipes/guessNutrition")
+
+    async def fetch():
+        deadline.detach()         # flight 是獨立 task：等的人被 deadline 取消，它照樣跑完
+        users.detach()
+        info = await _guess_nutrition(name)
+        _remember(name, info)     # 在 flight 裡記，下次問就是快取
+        return info
+    info = await _flights.do(norm_name(name) or name, fetch)
+    return dict(info) if info else None       # 每個等待者各拿一份，互不影響
+
+# ── 兩層快取 ───────────────────────────────────────────────
+# L1：行程內 LRU + TTL，「查不到」也記（短 TTL）
+# L2：nutrition_db（nutrition.csv 持久快取，重開機還在）
+_cache = TTLCache(maxsize     = int(os.getenv("CACHE_SIZE",         "2048")),
+                  ttl         = float(os.getenv("CACHE_TTL",        "3600")),
+                  negative_ttl= float(os.getenv("CACHE_NEGATIVE_TTL", "300")))
+_tier_stats = {"l2_hits": 0, "upstream": 0}
+
+def cache_stats() -> dict:
+    return {"l1": _cache.snapshot(), **_tier_stats}
+
+def _lookup_cached(name: str):
+    """只查 L1 / L2，不碰網路；都沒有回 MISS，確定查不到回 None。"""
+    key = norm_name(name) or name
+    if (info := _cache.get(key)) is not MISS:
+        return dict(info) if info else None
+
+    if (info := nutrition_db.lookup_food(name)):
+        _tier_stats["l2_hits"] += 1
+        _cache.put(key, info)
+        return info
+    return MISS
+
+def _remember(name: str, info: dict | None):
+    _cache.put(norm_name(name) or name, dict(info) if info else None)
+    if info:
+        nutrition_db.add_food(info, alias=name)
+
+async def _lookup_name(name: str):
+    with metrics.STAGE.time("cache"):
+        info = _lookup_cached(name)
+    if info is not MISS:
+        return info
+
+    # API 丟例外（逾時、額度用完）不快取，只有「確定查不到」才記 None
+    _tier_stats["upstream"] += 1
+    return await _guess_nutrition_once(name)
+
+# ── 一餐多樣：快取先查，沒中的一次丟 parseIngredients，剩下的並行 guess ──
+_NUTRIENTS = ("calories", "protein", "fat", "carbs")
+
+async def _parse_ingredients(names: list[str]) -> dict[str, dict]:
+    """
+    多行一次查；Spoonacular 看不懂的那行（沒熱量）就不回。
+    回應不保證一行一筆、照順序（看不懂的行可能整筆不見），
+    所以用每筆的 original（送出去的那一行）對回是哪個名字，對不上的丟掉。
+    """
+    lines = {" ".join(f"1 {n}".split()): n for n in names}
+    r = await spoonacular.request(
+        "POST", f"{BASE}/recipes/parseIngredients",
+        params  = {"apiKey": API_KEY},
+        data    = {"ingredientList": "\n".join(lines),
+                   "servings": 1, "includeNutrition": "true"},
+        timeout = http_pool.timeout(15))
+    r.raise_for_status()
+    out = {}
+    for item in r.json():
+        name = lines.get(" ".join(str(item.get("original") or "").split()))
+        if name is None or name in out:
+            continue
+        nutr = {n["name"]: n["amount"]
+                for n in (item.get("nutrition") or {}).get("nutrients", [])}
+        if item.get("id") and nutr.get("Calories"):
+            out[name] = {
+                "name"     : name,
+                "calories" : round(nutr["Calories"]),
+                "protein"  : round(nutr.get("Protein", 0), 1),
+                "fat"      : round(nutr.get("Fat", 0), 1),
+                "carbs"    : round(nutr.get("Carbohydrates", 0), 1),
+            }
+    return out
+
+# 套餐自己的截止時間要比整個事件的 deadline 早一點，
+# 不然外層 deadline.within() 先到，整份都被取消，連查到的那幾樣也回不了
+MEAL_MARGIN = float(os.getenv("MEAL_MARGIN", "0.2"))
+
+def _meal_time_left() -> float | None:
+    left = deadline.remaining()
+    return None if left == math.inf else max(0.0, left - MEAL_MARGIN)
+
+async def _lookup_meal(items: list[tuple[str, float]]) -> dict | None:
+    found: dict[str, dict | None] = {}
+    misses = []
+    for name, _ in items:
+        if (info := _lookup_cached(name)) is MISS:
+            misses.append(name)
+        else:
+            found[name] = info
+    misses = list(dict.fromkeys(misses))
+    limited = False                       # 這個人的額度用完了：快取有的照回，沒有的不再一樣樣試
+
+    if len(misses) > 1:                   # 兩樣以上沒中才值得批次
+        _tier_stats["upstream"] += 1
+        try:
+            batch = await asyncio.wait_for(_parse_ingredients(misses), _meal_time_left())
+        except UserLimited:
+            limited, batch = True, {}
+        except Exception as e:
+            print("[Spoonacular parseIngredients]", e)
+            batch = {}
+        for name, info in batch.items():
+            found[name] = info
+            _remember(name, info)
+        misses = [n for n in misses if n not in batch]
+
+    if misses and not limited and _meal_time_left() != 0:  # 剩下的各自 guessNutrition，同時發
+        tasks = {asyncio.ensure_future(_lookup_name(n)): n for n in misses}
+        done, pending = await asyncio.wait(tasks, timeout=_meal_time_left())
+        for t in pending:                 # 時間到還沒回來的先當查不到，回部分結果
+            t.cancel()
+        for t in done:
+            exc = t.exception()
+            limited |= isinstance(exc, UserLimited)
+            found[tasks[t]] = None if exc else t.result()
+
+    rows, total = [], dict.fromkeys(_NUTRIENTS, 0.0)
+    for name, qty in items:
+        info = found.get(name)
+        if not info:
+            rows.append({"name": name, "qty": qty, "missing": True})
+            continue
+        row = {"name": info["name"], "qty": qty}
+        for k in _NUTRIENTS:
+            row[k] = round(info[k] * qty, 1)
+            total[k] += row[k]
+        rows.append(row)
+
+    if all(r.get("missing") for r in rows):
+        if limited:                       # 一樣都沒有是因為沒額度，不是查不到
+            raise UserLimited("meal lookup")
+        return None
+    return {"name": " + ".join(name for name, _ in items), "items": rows,
+            **{k: round(v, 1) for k, v in total.items()}}
+
+# ── 照片去重：近似的照片沿用上次的分類，不再上傳 /food/images/analyze ──
+_phash = PhashIndex(os.getenv("PHASH_FILE", pathlib.Path(__file__).with_name("image_hashes.json")),
+                    maxsize      = int(os.getenv("PHASH_SIZE",     "4096")),
+                    max_distance = int(os.getenv("PHASH_DISTANCE", "6")))
+
+# ── 圖片分類後端 ───────────────────────────────────────────
+# CLASSIFIER=auto（預設）：本機 k-NN 先猜，信心 < LOCAL_MIN_CONF 才問 Spoonacular
+#            local      ：只用本機（額度用完 / 離線時）
+#            spoonacular：只用 Spoonacular
+CLASSIFIER     = os.getenv("CLASSIFIER", "auto")
+LOCAL_MIN_CONF = float(os.getenv("LOCAL_MIN_CONF", "0.6"))
+_local = KnnClassifier()
+_image_stats = {"local": 0, "spoonacular": 0, "local_low_conf": 0, "local_fallback": 0}
+
+async def _classify_image(image: bytes, mime: str) -> str | None:
+    """回分類標籤；近似照片看過就直接用舊的。"""
+    try:
+        h = await asyncio.to_thread(dhash, image)
+    except Exception:                     # Pillow 讀不了就照舊上傳
+        h = None
+    if h is not None and (label := _phash.find(h)):
+        return label
+
+    label = guess = None
+    with metrics.STAGE.time("classify_local"):
+        res = await _local.classify(image) if CLASSIFIER in ("auto", "local") else None
+    if res:
+        label, conf = res
+        if conf >= LOCAL_MIN_CONF:
+            _image_stats["local"] += 1
+        else:
+            _image_stats["local_low_conf"] += 1
+            label, guess = None, label
+    if label is None and CLASSIFIER != "local":
+        with metrics.STAGE.time("image_prep"):
+            image, mime = await image_prep.prepare(image, mime)    # 縮圖、去 EXIF 再上傳
+        try:
+            res = await _post_image(image, mime)
+        except (UpstreamUnavailable, deadline.DeadlineExceeded):
+            if guess is None:
+                raise
+            _image_stats["local_fallback"] += 1    # Spoonacular 休息中 / 來不及：信心低也先用本機的
+            return guess                           # 不記進 phash，下次還有機會問 Spoonacular
+        label = res["category"]["name"]   # Food-101 類別名稱
+        _image_stats["spoonacular"] += 1
+
+    if h is not None and label:
+        _phash.add(h, label)
+    return label
+
 # ── 對外 ───────────────────────────────────────────────────
-async def classify_and_lookup(*, text: str | None = None,
-                              img_path: str | None = None):
-    if text:                              # 文字直接估營養
-        return await _guess_nutrition(text)
+async def warm_up():
+    """import 時不讀檔；lifespan 開機後在背景呼叫，把資料表、照片雜湊、參考庫先載好。"""
+    await asyncio.gather(nutrition_db.warm_up(),
+                         asyncio.to_thread(_phash.load),
+                         _local.warm_up())
 
-    if img_path:                          # 圖片 → 類別 → 營養
+# ── 對外 ───────────────────────────────────────────────────
+async def classify_and_lookup(*, text: str | None = None,
+                              img_path: str | None = None,
+                              image: bytes | None = None,
+                              mime: str = "image/jpeg"):
+    if text:                              # 文字：快取 → API 估營養
+        items = parse_meal(text)
+        # 「雞腿便當+珍奶」拆開算；整串本身就是快取裡已知的菜就不拆
+        if is_meal(items) and _lookup_cached(text) is MISS:
+            return await _lookup_meal(items)
+        return await _lookup_name(text)
+
+    if img_path and image is None:        # 舊介面：檔案路徑，到 thread 裡讀
+        image = await asyncio.to_thread(pathlib.Path(img_path).read_bytes)
+
+    if image:                             # 圖片 → 類別 → 營養
         try:
-            res  = await _post_image(img_path)
-            label = res["category"]["name"]          # Food-101 類別名稱
+            label = await _classify_image(image, mime)
+        except (UpstreamUnavailable, deadline.DeadlineExceeded):
+            raise                         # 讓呼叫端回「服務休息中 / 來不及」，不是「認不出來」
         except Exception:
             return None
-        return await _guess_nutrition(label)
+        return await _lookup_name(label) if label else None
 
     return None            # 兩個都沒給
@@ -0,0 +1,49 @@
+# http_pool.py ────────────────────────────────────────────────────────
+# 全 app 共用的 httpx.AsyncClient：連線保持 keep-alive，不用每則訊息都重做
+# TCP + TLS 握手。每個上游各一個 client，連線上限就是 per-host 的。
+# 由 main.py 的 FastAPI lifespan 在關機時 aclose()。
+# ----------------------------------------------------------------------
+import os, importlib.util, httpx
+import deadline
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT    = float(os.getenv("HTTP_READ_TIMEOUT",    "15"))
+
+# HTTP2=1 而且有裝 h2（pip install "httpx[http2]"）才開
+HTTP2 = os.getenv("HTTP2", "0") == "1" and importlib.util.find_spec("h2") is not None
+
+# 上游名稱 → (最多幾條連線, 最多留幾條 idle keep-alive)
+_LIMITS = {
+    "spoonacular": (int(os.getenv("SPOON_MAX_CONN", "20")), 10),
+    "line":        (int(os.getenv("LINE_MAX_CONN",  "20")), 10),
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def timeout(read: float = READ_TIMEOUT, connect: float = CONNECT_TIMEOUT) -> httpx.Timeout:
+    """
+    連線和讀取分開算；write / pool 等待跟 read 一樣。
+    在事件的 deadline.scope() 裡呼叫時，兩個都會夾到剩餘時間。
+    """
+    return httpx.Timeout(deadline.clamp(read), connect=deadline.clamp(connect))
+
+
+def client(host: str) -> httpx.AsyncClient:
+    """拿某個上游的共用 client；第一次用到才建立。"""
+    if (c := _clients.get(host)) is None or c.is_closed:
+        max_conn, keepalive = _LIMITS.get(host, (10, 5))
+        c = _clients[host] = httpx.AsyncClient(
+            http2   = HTTP2,
+            timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),  # 不受建立當下的 deadline 影響
+            limits  = httpx.Limits(max_connections=max_conn,
+                                   max_keepalive_connections=keepalive,
+                                   keepalive_expiry=30),
+        )
+    return c
+
+
+async def aclose():
+    for c in _clients.values():
+        await c.aclose()
+    _clients.clear()
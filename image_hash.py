@@ -0,0 +1,162 @@
+# image_hash.py ───────────────────────────────────────────────────────
+# 食物照片的感知雜湊（dHash, 64 bit）+ 近似查詢。
+# 同一張照片被轉傳、重新壓縮、截圖，dHash 只差幾個 bit，
+# 找到就直接沿用上次 Spoonacular 的分類結果，不用再上傳。
+# ----------------------------------------------------------------------
+import atexit, io, json, os, pathlib, queue, threading
+from collections import OrderedDict
+
+_BANDS = 8                       # 64 bit 切 8 段，每段 8 bit
+
+
+def dhash(image: bytes) -> int:
+    """縮成 9×8 灰階，每列相鄰像素比大小 → 64 bit。會用到 CPU，請丟 thread 跑。"""
+    from PIL import Image
+    with Image.open(io.BytesIO(image)) as im:
+        im.draft("L", (64, 64))                  # JPEG 直接用低解析度解碼，快很多
+        px = list(im.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    h = 0
+    for row in range(8):
+        for col in range(8):
+            h = (h << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return h
+
+
+def _bands(h: int):
+    for i in range(_BANDS):
+        yield i, (h >> (i * 8)) & 0xFF
+
+
+class PhashIndex:
+    """
+    有上限的 LRU：dHash → 分類標籤，存成 JSON，重開機還在。
+    近似查詢用「分段完全相同」篩候選（鴿籠原理：距離 ≤ 7 一定有一段完全一樣），
+    再算真正的漢明距離，不用整表掃。
+    """
+
+    def __init__(self, path: pathlib.Path, *, maxsize: int = 4096,
+                 max_distance: int = 6, save_every: int = 32):
+        assert max_distance < _BANDS
+        self.path         = pathlib.Path(path)
+        self.maxsize      = maxsize
+        self.max_distance = max_distance
+        self.save_every   = save_every
+        self._items: OrderedDict[int, str] = OrderedDict()
+        self._buckets: dict[tuple[int, int], set[int]] = {}
+        self._dirty = 0
+        self._q: queue.SimpleQueue = queue.SimpleQueue()   # 快照 → 唯一的寫入 thread
+        self._writer: threading.Thread | None = None
+        self._load_lock = threading.Lock()
+        self.stats  = {"hits": 0, "misses": 0, "evictions": 0}
+        self._loaded = False                     # 第一次用到（或 load()）才讀檔
+        atexit.register(self.save)
+
+    def __len__(self):
+        if not self._loaded:
+            self.load()
+        return len(self._items)
+
+    # ── 查 / 加 ────────────────────────────────────────────────────
+    def find(self, h: int) -> str | None:
+        if not self._loaded:
+            self.load()
+        best, best_d = None, self.max_distance + 1
+        for band in _bands(h):
+            for cand in self._buckets.get(band, ()):
+                d = (cand ^ h).bit_count()
+                if d < best_d:
+                    best, best_d = cand, d
+        if best is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._items.move_to_end(best)
+        return self._items[best]
+
+    def add(self, h: int, label: str):
+        if not self._loaded:
+            self.load()
+        self._insert(h, label)
+        self._dirty += 1
+        if self._dirty >= self.save_every:
+            # 在這裡先拍快照，寫檔丟給背景 thread，不卡 event loop
+            self._q.put(self._dump())
+            self._start()
+
+    def _insert(self, h: int, label: str):
+        if h not in self._items:
+            for band in _bands(h):
+                self._buckets.setdefault(band, set()).add(h)
+        self._items[h] = label
+        self._items.move_to_end(h)
+        while len(self._items) > self.maxsize:
+            old, _ = self._items.popitem(last=False)
+            for band in _bands(old):
+                bucket = self._buckets[band]
+                bucket.discard(old)
+                if not bucket:
+                    del self._buckets[band]
+            self.stats["evictions"] += 1
+
+    # ── 存 / 讀 ────────────────────────────────────────────────────
+    def _dump(self) -> list:
+        self._dirty = 0
+        return [[f"{h:016x}", label] for h, label in self._items.items()]
+
+    def _write(self, data: list):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def _start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run, name="phash-writer", daemon=True)
+            self._writer.start()
+
+    def _run(self):
+        """只有這個 thread 寫檔；排了好幾份快照只寫最新的，舊的不會蓋掉新的。"""
+        while True:
+            items = [self._q.get()]
+            while True:
+                try:
+                    items.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            snaps = [i for i in items if isinstance(i, list)]
+            if snaps:
+                try:
+                    self._write(snaps[-1])
+                except OSError as e:
+                    print("[phash] 寫檔失敗，下次存檔再試", e, flush=True)
+            for i in items:
+                if isinstance(i, threading.Event):
+                    i.set()
+
+    def save(self, timeout: float = 5.0):
+        """關機時存檔；寫入 thread 在跑就排在它後面等它寫完，不跟它搶。"""
+        if not self._dirty:
+            return
+        data = self._dump()
+        if self._writer is None or not self._writer.is_alive():
+            self._write(data)
+            return
+        done = threading.Event()
+        self._q.put(data)
+        self._q.put(done)
+        done.wait(timeout)
+
+    def load(self):
+        """讀檔建回索引；做過就不再做。讀完才標 _loaded，讀到一半別人不會看到半張表。"""
+        with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = []
+            for hx, label in data[-self.maxsize:]:
+                self._insert(int(hx, 16), label)
+            self._loaded = True
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, loaded=self._loaded, size=len(self._items), maxsize=self.maxsize)
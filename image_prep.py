@@ -0,0 +1,106 @@
+# image_prep.py ───────────────────────────────────────────────────────
+# 上傳 Spoonacular 前先把手機原圖縮小、去 EXIF、重新壓成 JPEG。
+# 分類用不到幾 MB 的原圖，縮到長邊 1024 就夠，上傳快很多；
+# 本來就小、重壓也不會比較小的（又沒 EXIF 要去）就原圖照傳。
+# 解碼 / 縮圖吃 CPU，放到 process pool（或 thread pool）跑，
+# 再用 semaphore 限制同時幾張，event loop 不會卡住。
+# process pool 用 forkserver 開（沒有就 spawn）：server 裡已經有一堆 thread 跟鎖，
+# 直接 fork 會把鎖在別人手上的狀態一起複製過去，子行程可能卡死；
+# lifespan warm-up 就先把 worker 開好，第一張照片不用等。
+# ----------------------------------------------------------------------
+import asyncio, io, multiprocessing, os, time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+MAX_SIDE    = int(os.getenv("IMAGE_MAX_SIDE",    "1024"))
+QUALITY     = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+POOL_KIND   = os.getenv("IMAGE_PREP_POOL", "process")          # process | thread
+WORKERS     = int(os.getenv("IMAGE_PREP_WORKERS", str(min(4, os.cpu_count() or 1))))
+CONCURRENCY = int(os.getenv("IMAGE_PREP_CONCURRENCY", str(WORKERS)))
+
+_pool: Executor | None = None
+_sem:  asyncio.Semaphore | None = None
+stats = {"images": 0, "failed": 0, "kept_original": 0, "bytes_in": 0, "bytes_out": 0,
+         "ms_total": 0.0}
+
+
+def shrink(image: bytes, max_side: int = MAX_SIDE, quality: int = QUALITY) -> bytes | None:
+    """
+    在 worker 裡跑：轉正方向 → 縮圖 → 存成不含 EXIF 的 JPEG。
+    本來就夠小又沒 EXIF、或重壓反而變大（而且沒 EXIF 要去）就回 None：照原圖傳。
+    """
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(image)) as im:
+        has_exif = bool(im.info.get("exif"))
+        if max(im.size) <= max_side and not has_exif:
+            return None
+        im.draft("RGB", (max_side, max_side))        # JPEG 先用低解析度解碼
+        im = ImageOps.exif_transpose(im)              # 方向先套用，EXIF 才能丟
+        im = im.convert("RGB")
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=quality, optimize=True)   # 沒帶 exif= 就不會寫 EXIF
+    if len(out.getvalue()) >= len(image) and not has_exif:
+        return None
+    return out.getvalue()
+
+
+def _executor() -> Executor:
+    global _pool
+    if _pool is None:
+        if POOL_KIND == "process":
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context(method))
+        else:
+            _pool = ThreadPoolExecutor(WORKERS, thread_name_prefix="image-prep")
+    return _pool
+
+
+async def warm_up():
+    """開好 pool、每個 worker 先跑一次（import Pillow），第一張照片不用等開行程。"""
+    loop = asyncio.get_running_loop()
+    pool = _executor()
+    await asyncio.gather(*(loop.run_in_executor(pool, _ready) for _ in range(WORKERS)))
+
+
+def _ready() -> bool:
+    import PIL.Image  # noqa: F401
+    return True
+
+
+async def prepare(image: bytes, mime: str = "image/jpeg") -> tuple[bytes, str]:
+    """回 (要上傳的 bytes, mime)；Pillow 讀不了、或縮了沒比較小就原圖照傳。"""
+    global _sem
+    if _sem is None:
+        _sem = asyncio.Semaphore(CONCURRENCY)
+    t0 = time.perf_counter()
+    async with _sem:
+        try:
+            out = await asyncio.get_running_loop().run_in_executor(_executor(), shrink, image)
+        except Exception as e:
+            stats["failed"] += 1
+            print("[image-prep]", type(e).__name__, e, flush=True)
+            return image, mime
+    if out is None:                                   # 縮了也沒比較小：原圖照傳
+        stats["kept_original"] += 1
+        out = image
+    else:
+        mime = "image/jpeg"
+    stats["images"]    += 1
+    stats["bytes_in"]  += len(image)
+    stats["bytes_out"] += len(out)
+    stats["ms_total"]  += (time.perf_counter() - t0) * 1e3
+    return out, mime
+
+
+def snapshot() -> dict:
+    n = stats["images"]
+    return dict(stats,
+                bytes_saved = stats["bytes_in"] - stats["bytes_out"],
+                ms_avg      = stats["ms_total"] / n if n else 0.0)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,138 @@
+# importer.py ─────────────────────────────────────────────────────────
+# 把大張的公開食物成分表一次匯入成 nutrition.col（見 colstore.py），
+# 上線第一天大部分的查詢就在本機解決，不用等 cache miss 一筆一筆打 Spoonacular。
+#   - 分塊串流讀（CSV / TSV / JSON Lines），幾十萬列也不會整張進記憶體
+#   - 單位換算成每 100 g、kJ → kcal，整欄向量運算
+#   - 正規化名稱（textnorm.norm_name）去重，先出現的為準
+#   - 邊讀邊寫進 colstore，一趟就把查詢索引建好
+#
+#   python importer.py foods.csv                              # 欄位名稱跟 nutrition.csv 一樣
+#   python importer.py en.openfoodfacts.org.products.csv --preset off
+#   python importer.py tfda.csv --preset tfda -o nutrition.col
+#   python importer.py foods.jsonl --name description --kcal energy \
+#         --kj --basis-col serving_g                           # 自訂欄位、每份 → 每 100 g
+# ----------------------------------------------------------------------
+import argparse, json, pathlib, time
+
+import colstore
+from textnorm import norm_name
+
+# 各資料來源的欄位對應：name / kcal / kj / protein / fat / carb / basis（每幾克的數值）
+PRESETS = {
+    "nutrition": dict(name="name", kcal="kcal", protein="protein", fat="fat", carb="carb"),
+    "spoonacular": dict(name="name", kcal="calories", protein="protein", fat="fat", carb="carbs"),
+    # Open Food Facts 全量匯出（TSV，欄位都是 *_100g）
+    "off": dict(name="product_name", kcal="energy-kcal_100g", kj="energy_100g",
+                protein="proteins_100g", fat="fat_100g", carb="carbohydrates_100g", sep="\t"),
+    # 衛福部食品營養成分資料庫（每 100 g）
+    "tfda": dict(name="樣品名稱", kcal="熱量(kcal)", protein="粗蛋白(g)",
+                 fat="粗脂肪(g)", carb="總碳水化合物(g)"),
+}
+NUTRIENTS = ("kcal", "protein", "fat", "carb")
+KJ_PER_KCAL = 4.184
+
+
+def _chunks(path: pathlib.Path, fmt: str, sep: str, usecols: list[str], chunksize: int):
+    import pandas as pd
+    if fmt == "jsonl":
+        for df in pd.read_json(path, lines=True, chunksize=chunksize, dtype=False):
+            yield df.reindex(columns=usecols)
+    elif fmt == "json":                   # 一整個陣列沒辦法串流，讀進來再切
+        df = pd.DataFrame(json.loads(path.read_text(encoding="utf-8"))).reindex(columns=usecols)
+        for i in range(0, len(df), chunksize):
+            yield df.iloc[i:i + chunksize]
+    else:
+        yield from pd.read_csv(path, sep=sep, usecols=lambda c: c in usecols, dtype=str,
+                               chunksize=chunksize, on_bad_lines="skip", encoding_errors="replace")
+
+
+def normalize(df, cols: dict, *, kj: bool = False, basis: float = 100.0):
+    """
+    一塊原始資料 → name / key / kcal / protein / fat / carb（每 100 g）。
+    全部整欄算；沒名字、沒熱量的列丟掉。
+    """
+    import pandas as pd
+    out = pd.DataFrame({"name": df[cols["name"]].astype("string").str.strip()})
+    for n in NUTRIENTS:
+        src = cols.get(n)
+        out[n] = pd.to_numeric(df[src], errors="coerce") if src in df else float("nan")
+
+    if kj:                                # 熱量欄本身是 kJ
+        out["kcal"] = out["kcal"] / KJ_PER_KCAL
+    if (src := cols.get("kj")) in df:     # 只有 kJ 的列補成 kcal
+        out["kcal"] = out["kcal"].fillna(pd.to_numeric(df[src], errors="coerce") / KJ_PER_KCAL)
+
+    # 每份 / 每 basis 克 → 每 100 g
+    if (src := cols.get("basis")) in df:
+        scale = 100.0 / pd.to_numeric(df[src], errors="coerce")
+    else:
+        scale = 100.0 / basis
+    for n in NUTRIENTS:
+        out[n] = out[n] * scale
+
+    out = out[out["name"].notna() & out["name"].ne("") & out["kcal"].notna()]
+    out[list(NUTRIENTS[1:])] = out[list(NUTRIENTS[1:])].fillna(0.0)
+    ok = (out[list(NUTRIENTS)] >= 0).all(axis=1) & (out["kcal"] <= 900 * 1.05)  # 純油也才 900 kcal
+    out = out[ok]
+    out["key"] = out["name"].map(norm_name)
+    return out[out["key"] != ""]
+
+
+def run(src: pathlib.Path, dst: pathlib.Path, cols: dict, *, fmt: str, sep: str,
+        kj: bool, basis: float, chunksize: int) -> dict:
+    stats = {"read": 0, "invalid": 0, "duplicates": 0, "written": 0}
+    seen: set[str] = set()
+    usecols = [c for k, c in cols.items() if k != "sep" and c]
+
+    def rows():
+        for raw in _chunks(src, fmt, sep, usecols, chunksize):
+            stats["read"] += len(raw)
+            df = normalize(raw, cols, kj=kj, basis=basis)
+            stats["invalid"] += len(raw) - len(df)
+            fresh = df.drop_duplicates("key")            # 同一塊裡先去重
+            fresh = fresh[~fresh["key"].isin(seen)]      # 再去掉前面幾塊出現過的
+            stats["duplicates"] += len(df) - len(fresh)
+            seen.update(fresh["key"])
+            yield from fresh.to_dict("records")
+
+    stats["written"] = colstore.build(rows(), dst)
+    return stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="公開食物成分表 → nutrition.col")
+    ap.add_argument("src", type=pathlib.Path)
+    ap.add_argument("-o", "--out", type=pathlib.Path,
+                    default=pathlib.Path(__file__).with_name("nutrition.col"))
+    ap.add_argument("--preset", choices=sorted(PRESETS), default="nutrition")
+    ap.add_argument("--format", choices=["csv", "json", "jsonl"],
+                    help="預設看副檔名（.json / .jsonl / .ndjson，其他當 CSV）")
+    ap.add_argument("--sep", help="CSV 分隔符號（預設逗號，.tsv 用 tab）")
+    for k in ("name", "kcal", "protein", "fat", "carb"):
+        ap.add_argument(f"--{k}", metavar="COL", help=f"{k} 的欄位名稱（蓋過 preset）")
+    ap.add_argument("--kj", action="store_true", help="熱量欄是 kJ")
+    ap.add_argument("--basis", type=float, default=100.0, help="數值是每幾克（預設 100）")
+    ap.add_argument("--basis-col", metavar="COL", help="每列各自的克數欄位（例如每份重量）")
+    ap.add_argument("--chunksize", type=int, default=50_000)
+    args = ap.parse_args(argv)
+
+    cols = dict(PRESETS[args.preset])
+    for k in ("name", "kcal", "protein", "fat", "carb"):
+        if getattr(args, k):
+            cols[k] = getattr(args, k)
+    if args.basis_col:
+        cols["basis"] = args.basis_col
+
+    suffix = args.src.suffix.lower()
+    fmt = args.format or {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl"}.get(suffix, "csv")
+    sep = args.sep or cols.get("sep") or ("\t" if suffix == ".tsv" else ",")
+
+    t0 = time.perf_counter()
+    stats = run(args.src, args.out, cols, fmt=fmt, sep=sep, kj=args.kj,
+                basis=args.basis, chunksize=args.chunksize)
+    print(f"{args.src} → {args.out}  {time.perf_counter() - t0:.1f}s  "
+          + "  ".join(f"{k}={v:,}" for k, v in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# intake.py ───────────────────────────────────────────────────────────
+# 每個使用者每天吃了什麼：查到營養就記一筆，「今天吃了多少」直接讀累計值。
+#   - 記憶體裡每個 (使用者, 日期) 一份累計（熱量 / 三大營養素 / 幾樣），
+#     記一筆就是加一次，查詢 O(1)，不用回頭掃紀錄
+#   - 紀錄一天一個 JSON Lines 檔（intake/2026-01-31.jsonl），只往後接；
+#     丟進 queue 就回，背景 thread 批次寫，不拖慢營養回覆
+#   - 開機只讀最近 INTAKE_KEEP_DAYS 天的檔把累計值建回來（warm-up 在 thread 裡讀）
+#   - 多個 worker 寫同一個目錄：問「今天吃了多少」時把今天的檔從上次讀到的地方
+#     接著讀，別的 worker 記的也算得到；每筆帶寫入者 id，自己寫的不重複加
+# ----------------------------------------------------------------------
+import asyncio, atexit, datetime as dt, json, os, pathlib, queue, threading, time, uuid
+
+INTAKE_DIR = pathlib.Path(os.getenv("INTAKE_DIR", pathlib.Path(__file__).with_name("intake")))
+KEEP_DAYS  = int(os.getenv("INTAKE_KEEP_DAYS", "7"))
+MAX_ITEMS  = 20                          # 每天的明細只留最後幾樣給回覆用
+RETRY_INTERVAL = 5.0                     # 寫失敗後隔幾秒再試
+
+try:                                     # 「今天」照台灣時間算
+    from zoneinfo import ZoneInfo
+    TZ = ZoneInfo(os.getenv("INTAKE_TZ", "Asia/Taipei"))
+except Exception:                        # 沒有 tzdata 就固定 +8
+    TZ = dt.timezone(dt.timedelta(hours=8))
+
+_NUTRIENTS = ("calories", "protein", "fat", "carbs")
+
+
+def _day(ts: float | None = None) -> str:
+    return dt.datetime.fromtimestamp(time.time() if ts is None else ts, TZ).date().isoformat()
+
+
+class IntakeLog:
+    def __init__(self, path: pathlib.Path, *, keep_days: int = KEEP_DAYS,
+                 flush_every: int = 64, flush_interval: float = 1.0):
+        self.path = pathlib.Path(path)
+        self.keep_days      = keep_days
+        self.flush_every    = flush_every
+        self.flush_interval = flush_interval
+        self._days: dict[tuple[str, str], dict] = {}    # (user, 日期) → 累計
+        self._today = ""
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._writer = uuid.uuid4().hex[:12]            # 這個 process 寫的紀錄
+        self._offsets: dict[str, int] = {}              # 日期 → 那天的檔讀到第幾個 byte
+        self._tail_lock = threading.Lock()
+        self.stats = {"records": 0, "written": 0, "loaded": 0, "synced": 0}
+
+    # ── 讀 ─────────────────────────────────────────────────────────
+    def load(self):
+        """讀最近幾天的檔建回累計值；做過就不再做。"""
+        with self._load_lock:
+            if self._loaded:
+                return
+            today = dt.date.fromisoformat(_day())
+            for i in range(self.keep_days - 1, -1, -1):
+                day = (today - dt.timedelta(days=i)).isoformat()
+                f = self.path / f"{day}.jsonl"
+                try:
+                    data = f.read_bytes()
+                except OSError:
+                    continue
+                if data and not data.endswith(b"\n"):   # 寫到一半當機：截掉半行，不然下一筆會黏上去
+                    data = data[:data.rfind(b"\n") + 1]
+                    with open(f, "r+b") as fp:
+                        fp.truncate(len(data))
+                self._offsets[day] = len(data)
+                for rec in _parse(data):
+                    self._add(rec["user"], day, rec)
+                    self.stats["loaded"] += 1
+            self._today = today.isoformat()
+            self._start()
+            self._loaded = True
+
+    async def warm_up(self):
+        await asyncio.to_thread(self.load)
+
+    def _tail(self, day: str) -> list[dict]:
+        """那天的檔從上次讀到的地方往後讀（別的 worker 接上去的）；在 thread 裡跑。"""
+        with self._tail_lock:
+            start = self._offsets.get(day, 0)
+            try:
+                with open(self.path / f"{day}.jsonl", "rb") as fp:
+                    fp.seek(start)
+                    data = fp.read()
+            except OSError:
+                return []
+            data = data[:data.rfind(b"\n") + 1]            # 別人寫到一半的那行下次再讀
+            self._offsets[day] = start + len(data)
+        return [rec for rec in _parse(data) if rec.get("w") != self._writer]
+
+    async def today(self, user: str) -> dict | None:
+        """今天的累計（含最後幾樣明細）；沒紀錄回 None。"""
+        if not self._loaded:
+            await self.warm_up()
+        day = _day()
+        for rec in await asyncio.to_thread(self._tail, day):
+            self._add(rec["user"], day, rec)
+            self.stats["synced"] += 1
+        tot = self._days.get((user, day))
+        return dict(tot, items=list(tot["items"])) if tot else None
+
+    # ── 寫 ─────────────────────────────────────────────────────────
+    async def record(self, user: str, info: dict, ts: float | None = None):
+        """O(1)：更新累計、排進背景寫檔。info 是 classify_and_lookup 回的營養 dict。"""
+        if not self._loaded:
+            await self.warm_up()
+        day = _day(ts)
+        rec = {"user": user, "ts": round(ts or time.time(), 3), "name": info["name"],
+               **{k: info.get(k) or 0 for k in _NUTRIENTS}, "w": self._writer}
+        if day > self._today:                # 換日：丟掉太舊的累計
+            self._today = day
+            self._prune()
+        self._add(user, day, rec)
+        self._q.put((day, json.dumps(rec, ensure_ascii=False)))
+        self.stats["records"] += 1
+
+    def _add(self, user: str, day: str, rec: dict):
+        tot = self._days.get((user, day))
+        if tot is None:
+            tot = self._days[(user, day)] = dict.fromkeys(_NUTRIENTS, 0.0) | {"count": 0, "items": []}
+        for k in _NUTRIENTS:
+            tot[k] = round(tot[k] + float(rec.get(k) or 0), 1)
+        tot["count"] += 1
+        tot["items"].append((rec["name"], rec.get("calories") or 0))
+        if len(tot["items"]) > MAX_ITEMS:
+            del tot["items"][0]
+
+    def _prune(self):
+        oldest = (dt.date.fromisoformat(self._today) - dt.timedelta(days=self.keep_days - 1)).isoformat()
+        for key in [k for k in self._days if k[1] < oldest]:
+            del self._days[key]
+        for day in [d for d in self._offsets if d < oldest]:
+            del self._offsets[day]
+
+    def flush(self, timeout: float = 5.0):
+        """等背景 thread 把排隊的紀錄寫完（測試 / 關機用）。"""
+        if self._thread:
+            done = threading.Event()
+            self._q.put(done)
+            done.wait(timeout)
+
+    def close(self):
+        if self._thread and self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join(timeout=10)
+
+    # ── 背景寫入 ───────────────────────────────────────────────────
+    def _start(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="intake-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        batch: dict[str, list[str]] = {}
+        pending, last, retry_at = 0, time.monotonic(), 0.0
+        while True:
+            try:
+                item = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ...
+            if isinstance(item, tuple):
+                day, line = item
+                batch.setdefault(day, []).append(line)
+                pending += 1
+                if pending < self.flush_every and time.monotonic() - last < self.flush_interval:
+                    continue
+            urgent = item is None or isinstance(item, threading.Event)
+            if pending and (urgent or time.monotonic() >= retry_at):
+                batch = {day: lines for day, lines in batch.items()
+                         if not self._append(day, lines, retry=retry_at > 0)}
+                left = sum(map(len, batch.values()))
+                self.stats["written"] += pending - left           # 真的進了檔才算
+                pending, last = left, time.monotonic()
+                retry_at = last + RETRY_INTERVAL if batch else 0.0   # 沒寫進去的留著，等一下再寫
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                if pending:
+                    print("[intake] 關機時還有", pending, "筆沒寫進去", flush=True)
+                break
+
+    def _append(self, day: str, lines: list[str], retry: bool = False) -> bool:
+        """
+        一天的一批接到檔尾並 fsync；失敗回 False。
+        一批一次 write（O_APPEND），跟別的 worker 的行不會交錯。
+        寫了一半的：檔尾還是自己那段就截掉；截不掉的話重試時先補一個換行，半行自己成一行被跳過。
+        """
+        data = ("\n" if retry else "") + "\n".join(lines) + "\n"
+        data = data.encode("utf-8")
+        try:
+            with open(self.path / f"{day}.jsonl", "a+b", buffering=0) as fp:
+                start = os.fstat(fp.fileno()).st_size
+                try:
+                    fp.write(data)
+                    os.fsync(fp.fileno())
+                except OSError:
+                    _undo(fp, start, data)
+                    raise
+        except OSError as e:
+            print("[intake] 寫入失敗，", day, len(lines), "筆晚點重試：", e, flush=True)
+            return False
+        return True
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, ready=self._loaded, entries=len(self._days),
+                    queued=self.stats["records"] - self.stats["written"])
+
+
+def _undo(fp, start: int, data: bytes):
+    """start 之後還只有自己寫的那段（沒人接在後面）才截回 start。"""
+    try:
+        size = os.fstat(fp.fileno()).st_size
+        if start < size <= start + len(data):
+            fp.seek(start)
+            if fp.read(size - start) == data[:size - start]:
+                fp.truncate(start)
+    except OSError:
+        pass
+
+
+def _parse(data: bytes):
+    for line in data.decode("utf-8").splitlines():
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+log = IntakeLog(INTAKE_DIR)
@@ -0,0 +1,170 @@
+# local_classifier.py ─────────────────────────────────────────────────
+# 離線、純 CPU 的食物照片分類：k-NN over 小特徵向量。
+#   參考圖放在 FOOD_REF_DIR（預設 food_refs/）：
+#     food_refs/pizza/1.jpg
+#     food_refs/pizza/2.jpg
+#     food_refs/滷肉飯/a.png ...
+#   資料夾名稱就是標籤。
+# 特徵 = RGB 4×4×4 色彩直方圖 + 16×16 灰階縮圖，L2 正規化後用 cosine 相似度。
+# 同時進來的請求會湊成一批，一次矩陣乘法算完（micro-batching）。
+# 不是參考庫裡那種東西的照片（白牆、純色截圖）不猜：
+#   - 灰階縮圖幾乎沒有起伏（對比 < LOCAL_MIN_CONTRAST）→ 不是食物照
+#   - 跟勝出那一類最像的參考圖，比那一類參考圖彼此之間還不像
+#     （每類的門檻 = 每張參考圖到同類最近那張的相似度取最小、再放寬 LOCAL_SIM_MARGIN，
+#       至少 LOCAL_MIN_SIM；新照片總是比參考圖彼此之間差一點）
+# ----------------------------------------------------------------------
+import asyncio, io, os, pathlib
+from collections import defaultdict
+
+REF_DIR      = pathlib.Path(os.getenv("FOOD_REF_DIR", pathlib.Path(__file__).with_name("food_refs")))
+K            = int(os.getenv("LOCAL_K", "5"))
+BATCH_SIZE   = int(os.getenv("LOCAL_BATCH_SIZE", "32"))
+BATCH_WINDOW = float(os.getenv("LOCAL_BATCH_WINDOW_MS", "5")) / 1e3
+MIN_SIM      = float(os.getenv("LOCAL_MIN_SIM", "0.75"))
+SIM_MARGIN   = float(os.getenv("LOCAL_SIM_MARGIN", "0.05"))
+MIN_CONTRAST = float(os.getenv("LOCAL_MIN_CONTRAST", "6"))      # 灰階標準差（0~255）
+_EXTS        = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def features(image: bytes):
+    """圖片 → float32 向量（已 L2 正規化）。吃 CPU，請丟 thread 跑。"""
+    return _features(image)[0]
+
+
+def _features(image: bytes):
+    """(向量, 灰階對比)；對比是縮圖的標準差，純色圖接近 0。"""
+    import numpy as np
+    from PIL import Image
+    with Image.open(io.BytesIO(image)) as im:
+        im.draft("RGB", (128, 128))
+        rgb = im.convert("RGB").resize((64, 64))
+    px   = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3) // 64          # 每個通道 4 格
+    hist = np.bincount(px[:, 0] * 16 + px[:, 1] * 4 + px[:, 2], minlength=64)
+    gray = np.asarray(rgb.convert("L").resize((16, 16)), dtype=np.float32).ravel()
+    gray -= gray.mean()
+    vec  = np.concatenate([hist.astype(np.float32) / hist.sum(),
+                           gray / (np.linalg.norm(gray) or 1.0) * 0.5])
+    return vec / (np.linalg.norm(vec) or 1.0), float(gray.std())
+
+
+class KnnClassifier:
+    def __init__(self, ref_dir: pathlib.Path = REF_DIR, k: int = K):
+        self.ref_dir = pathlib.Path(ref_dir)
+        self.k       = k
+        self.labels: list[str] = []
+        self._matrix = None                 # (N, D) float32
+        self._min_sim: dict[str, float] = {}   # 標籤 → 最像的參考圖至少要這麼像
+        self._loading: asyncio.Task | None = None
+        self._pending: list[tuple[object, asyncio.Future]] = []
+        self._flusher: asyncio.Task | None = None
+        self._batches: set[asyncio.Task] = set()  # event loop 只弱引用 task，自己留著
+        self.stats = {"requests": 0, "batches": 0, "flat": 0, "out_of_range": 0}
+
+    @property
+    def ready(self) -> bool:
+        return self._matrix is not None and len(self.labels) > 0
+
+    # ── 參考庫 ─────────────────────────────────────────────────────
+    def load(self):
+        """掃參考資料夾建矩陣；沒有資料夾就維持 not ready（全部走 Spoonacular）。"""
+        import numpy as np
+        if not self.ref_dir.is_dir():
+            return
+        vecs, labels = [], []
+        for path in sorted(self.ref_dir.glob("*/*")):
+            if path.suffix.lower() not in _EXTS:
+                continue
+            try:
+                vecs.append(features(path.read_bytes()))
+                labels.append(path.parent.name)
+            except Exception as e:
+                print("[local-classifier] 略過", path, e)
+        if vecs:
+            matrix, L = np.stack(vecs), np.array(labels)
+            min_sim = {}
+            for label in set(labels):
+                m = matrix[L == label]
+                sims = m @ m.T
+                np.fill_diagonal(sims, -1.0)
+                spread = float(sims.max(axis=1).min()) if len(m) > 1 else MIN_SIM
+                min_sim[label] = max(MIN_SIM, spread - SIM_MARGIN)
+            self._matrix, self.labels, self._min_sim = matrix, labels, min_sim
+        print(f"[local-classifier] {len(labels)} 張參考圖、{len(set(labels))} 類", flush=True)
+
+    async def warm_up(self):
+        """只載一次；同時很多人呼叫就一起等同一個 task。"""
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self.load))
+        await asyncio.shield(self._loading)
+
+    # ── 分類 ───────────────────────────────────────────────────────
+    async def classify(self, image: bytes) -> tuple[str, float] | None:
+        """回 (標籤, 信心 0~1)；參考庫是空的、或照片不像參考庫裡任何一類回 None。"""
+        await self.warm_up()
+        if not self.ready:
+            return None
+        vec, contrast = await asyncio.to_thread(_features, image)
+        if contrast < MIN_CONTRAST:
+            self.stats["flat"] += 1
+            return None
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((vec, fut))
+        self.stats["requests"] += 1
+        if len(self._pending) >= BATCH_SIZE:
+            self._flush_now()
+        elif self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_later())
+        return await fut
+
+    async def _flush_later(self):
+        await asyncio.sleep(BATCH_WINDOW)
+        self._flusher = None
+        self._flush_now()
+
+    def _flush_now(self):
+        batch, self._pending = self._pending, []
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if batch:
+            t = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(t)
+            t.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        import numpy as np
+        self.stats["batches"] += 1
+        try:
+            q = np.stack([v for v, _ in batch])
+            results = await asyncio.to_thread(self._knn, q)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), res in zip(batch, results):
+            if res is None:
+                self.stats["out_of_range"] += 1
+            if not fut.done():
+                fut.set_result(res)
+
+    def _knn(self, q) -> list[tuple[str, float] | None]:
+        """一批查詢一次矩陣乘法；前 k 名用相似度加權投票。"""
+        import numpy as np
+        sims = q @ self._matrix.T                          # (B, N)
+        k    = min(self.k, sims.shape[1])
+        top  = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        out  = []
+        for row, idx in zip(sims, top):
+            votes: dict[str, float] = defaultdict(float)
+            for i in idx:
+                votes[self.labels[i]] += max(float(row[i]), 0.0)
+            label, score = max(votes.items(), key=lambda kv: kv[1])
+            nearest = max(float(row[i]) for i in idx if self.labels[i] == label)
+            if nearest < self._min_sim[label]:             # 比這一類自己的參考圖彼此還不像
+                out.append(None)
+                continue
+            total = sum(votes.values()) or 1.0
+            # 信心 = 票數占比 × 最近鄰的相似度
+            out.append((label, score / total * max(float(row[idx].max()), 0.0)))
+        return out
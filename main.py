@@ -1,153 +1,186 @@
-import os, asyncio, tempfile, httpx
-from fastapi import FastAPI, Request, HTTPException
-from dotenv import load_dotenv ; load_dotenv()
-
-# ── LINE SDK ──────────────────────────────────────────────────────────
-from linebot.v3.messaging import (
-    Configuration, AsyncApiClient, AsyncMessagingApi,
-    ReplyMessageRequest, TextMessage,
-)
-from linebot.v3.messaging.exceptions import ApiException
-from linebot.v3.webhook import WebhookParser
-
-# ── 你的模組 ─────────────────────────────────────────────────────────
-from food_classifier import classify_and_lookup
-from chat            import try_reply, format_nutrition     # ← 改這行
-
-# ── LINE 初始化 ──────────────────────────────────────────────────────
-parser = WebhookParser(os.getenv("LINE_CHANNEL_SECRET", ""))
-conf   = Configuration(access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN", ""))
-api    = AsyncMessagingApi(AsyncApiClient(configuration=conf))
-
-# ── FastAPI ──────────────────────────────────────────────────────────
-app = FastAPI()
-
-@app.get("/healthz")
-async def healthz(): return {"ok": True}
-
-@app.post("/callback")
-async def callback(req: Request):
-    body      = await req.body()
-    signature = req.headers.get("X-Line-Signature", "")
-    try:
-        events = parser.parse(body.decode(), signature)
-    except Exception as e:
-        raise HTTPException(400, str(e))
-    await asyncio.gather(*[handle(ev) for ev in events])
-    return "OK"
-
-# ── 事件分派 ─────────────────────────────────────────────────────────
-async def handle(event):
-    try:
-        if event.message.type == "text":
-            await handle_text(event)
-        elif event.message.type == "image":
-            await handle_image(event)
-    except ApiException as e:
-        print("[LINE-API]", e.status, e.body)
-
-
-async def handle_text(event):
-    msg = event.message.text.strip()
-
-    # 1) 先跑關鍵字表
-    reply = try_reply(msg)
-    if reply:
-        await reply_text(event.reply_token, reply)
-        return
-
-    # 2) 查營養（加例外保護，避免 ReadTimeout 直接 500）
-    try:
-        info = await classify_and_lookup(text=msg)
-    except Exception as e:
-        print("[Spoonacular]", e)
-        info = None
-
-    reply = format_nutrition(info) if info else "找不到營養資料 QQ"
-    await reply_text(event.reply_token, reply)
-
-
-async def handle_image(event):
-    url = f"https://api-data.line.me/v2/bot/message/{event.message.id}/content"
-    headers = {"Authorization": f"Bearer {os.getenv('LINE_CHANNEL_ACCESS_TOKEN')}"}
-    async with httpx.AsyncClient(timeout=30) as c:
-        r = await c.get(url, headers=headers)
-    if r.status_code != 200:
-        await reply_text(event.reply_token, "圖片下載失敗 QQ"); return
-
-    with tempfile.NamedTemporaryFile(delete=False) as fp:
-        fp.write(r.content); img_path = fp.name
-
-    try:
-        info = await classify_and_lookup(img_path=img_path)
-    except Exception as e:
-        print("[Spoonacular]", e)
-        info = None
-
-    reply = format_nutrition(info) if info else "這張圖認不出是什麼食物 QQ"
-    await reply_text(event.reply_token, reply)
-
-
-async def reply_text(token: str, text: str):
-    await api.reply_message(
-        ReplyMessageRequest(
-            reply_token=token,
-            messages=[TextMessage(text=text)]
-        )
-    )
-
-#可以的
-import os, asyncio, tempfile, httpx
-from fastapi import FastAPI, Request, HTTPException
+import os, asyncio, tempfile, time, httpx
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Response
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv ; load_dotenv()
 
 # ── LINE SDK ───────────────────────────────────────────────────────────────────
 from linebot.v3.messaging import (
     Configuration, AsyncApiClient, AsyncMessagingApi,
-    ReplyMessageRequest, TextMessage,
+    ReplyMessageRequest, TextMessage, QuickReply, QuickReplyItem, MessageAction,
 )
 from linebot.v3.messaging.exceptions import ApiException
 from linebot.v3.webhook import WebhookParser
 
 # ── 你自己的模組 ─────────────────────────────────────────────────────────────
 from food_classifier import classify_and_lookup
-from chat            import try_greet, format_nutrition
+import food_classifier
+from chat            import try_reply, try_greet, format_nutrition, is_intake_query, format_intake
+from dispatcher      import Dispatcher
+import dedupe, deadline, http_pool, image_prep, intake, metrics, nutrition_db, ratelimit
+from ratelimit       import UpstreamUnavailable, UserLimited
 
 # ── LINE 初始化 ──────────────────────────────────────────────────────────────
 parser = WebhookParser(os.getenv("LINE_CHANNEL_SECRET", ""))
-conf   = Configuration(access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN", ""))
-api    = AsyncMessagingApi(AsyncApiClient(configuration=conf))
+# LINE_API_HOST / LINE_DATA_HOST 只有壓測（benchmarks/loadtest.py）會改，指到本機 stub
+conf   = Configuration(host=os.getenv("LINE_API_HOST") or None,
+                       access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN", ""))
+# aiohttp 的 session 會綁在建立當下的 event loop；import 時還不是 server 的 loop，
+# 所以留到 lifespan 裡才建
+api: AsyncMessagingApi | None = None
+
+# ── 事件 queue：/callback 先回 200，worker 在背景處理 ────────────────────────
+# 每個使用者一條，worker 輪流拿；一個人連丟一堆也只會塞住自己那條
+dispatcher = Dispatcher(lambda ev: handle(ev),
+                        workers = int(os.getenv("EVENT_WORKERS",    "8")),
+                        maxsize = int(os.getenv("EVENT_QUEUE_SIZE", "256")),
+                        key     = lambda ev: _user_id(ev),
+                        max_per_key = int(os.getenv("EVENT_QUEUE_PER_USER", "16")),
+                        on_overflow = lambda ev: reply_limited(ev))
+# LINE SDK 的連線池預設 CPU 數 × 5，worker 一多就在搶連線；
+# 每個 worker 一條、overflow 回覆再一條
+conf.connection_pool_maxsize = max(conf.connection_pool_maxsize, 2 * dispatcher.workers)
 
 # ── FastAPI ──────────────────────────────────────────────────────────────────
-app = FastAPI()
+# 資料表 / 參考庫不在開機路徑上讀：server 先起來，背景 warm-up 做完 /healthz 才回 200。
+# warm-up 前進來的訊息也能處理，只是第一次查詢時才順便載入。
+_warm = {"ready": False, "error": None, "seconds": None}
+
+async def _warm_up():
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(food_classifier.warm_up(), intake.log.warm_up(), image_prep.warm_up())
+    except Exception as e:
+        _warm["error"] = f"{type(e).__name__}: {e}"
+        print("[warm-up]", _warm["error"], flush=True)
+        return
+    _warm["ready"], _warm["seconds"] = True, round(time.perf_counter() - t0, 3)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global api
+    api = AsyncMessagingApi(AsyncApiClient(configuration=conf))
+    http_pool.client("spoonacular"); http_pool.client("line")   # 開機先建好連線池
+    await dispatcher.start()
+    warm = asyncio.create_task(_warm_up())
+    yield
+    # 關機：先把 queue 做完，再收掉共用連線池
+    warm.cancel()
+    await dispatcher.stop()
+    await http_pool.aclose()
+    image_prep.shutdown()
+    intake.log.close()
+    dedupe.seen.close()
+    await api.api_client.close()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/healthz")
-async def healthz():
-    return {"ok": True}
+async def healthz(response: Response):
+    if not _warm["ready"]:
+        response.status_code = 503        # 還在 warm-up，readiness probe 先別導流量
+    return {"ok": True, **_warm}
+
+@app.get("/stats")
+async def stats():
+    # 快取命中 / 淘汰、合併了幾次重複查詢
+    return {
+        "cache":        food_classifier.cache_stats(),
+        "singleflight": food_classifier._flights.stats,
+        "queue":        dispatcher.snapshot(),
+        "phash":        food_classifier._phash.snapshot(),
+        "image_prep":   image_prep.snapshot(),     # 省了多少上傳量、多花多少毫秒
+        "classifier":   dict(food_classifier._image_stats, **food_classifier._local.stats),
+        "spoonacular":  ratelimit.spoonacular.snapshot(),  # 斷路器狀態、剩餘點數
+        "intake":       intake.log.snapshot(),
+        "dedupe":       dedupe.seen.snapshot(),    # 擋掉幾個 LINE 重送的事件
+        "users":        ratelimit.users.snapshot(),  # 每人限流：被擋最多次的是誰
+    }
+
+@app.get("/stats/users/{user_id}")
+async def user_stats(user_id: str):
+    # 單一使用者：查了 / 被擋幾次、bucket 還剩多少、queue 裡還有幾個在等
+    return {"limiter": ratelimit.users.user(user_id),
+            "queued":  dispatcher.queued(user_id)}
+
+# ── /metrics：Prometheus 格式；各模組原本的 stats 在抓的當下才讀 ───────────
+def _collect():
+    q, c = dispatcher.snapshot(), food_classifier.cache_stats()
+    yield ("bot_queue_depth", "gauge", "事件 queue 目前長度", [({}, q["depth"])])
+    yield ("bot_queue_shed_total", "counter", "queue 滿了丟掉的事件", [({}, q["shed"])])
+    yield ("bot_queue_wait_seconds_max", "gauge", "事件在 queue 裡等最久的時間", [({}, q["wait_ms_max"] / 1e3)])
+    yield ("bot_cache_lookups_total", "counter", "營養快取查詢結果（l1 / l1_negative / l2 / miss）",
+           [({"result": "l1"}, c["l1"]["hits"]), ({"result": "l1_negative"}, c["l1"]["negative_hits"]),
+            ({"result": "l2"}, c["l2_hits"]), ({"result": "miss"}, c["upstream"])])
+    yield ("bot_singleflight_coalesced_total", "counter", "合併掉的重複查詢",
+           [({}, food_classifier._flights.stats["coalesced"])])
+    yield ("bot_phash_lookups_total", "counter", "照片雜湊查詢",
+           [({"result": k}, v) for k, v in food_classifier._phash.stats.items() if k in ("hits", "misses")])
+    sp = ratelimit.spoonacular.snapshot()
+    yield ("bot_breaker_open", "gauge", "Spoonacular 斷路器（0 closed / 1 half_open / 2 open）",
+           [({"host": "spoonacular"}, {"closed": 0, "half_open": 1, "open": 2}[sp["breaker"]])])
+    yield ("bot_spoonacular_quota_left", "gauge", "Spoonacular 今日剩餘點數", [({}, sp["quota"]["left"])])
+    d = dedupe.seen.stats
+    yield ("bot_webhook_duplicates_total", "counter", "重複的 webhookEventId，進 queue 前就丟掉",
+           [({"scope": "local"}, d["duplicates"] - d["shared_duplicates"]),
+            ({"scope": "shared"}, d["shared_duplicates"])])
+    yield ("bot_webhook_redeliveries_total", "counter", "LINE 標成 isRedelivery 的事件", [({}, d["redeliveries"])])
+    u = ratelimit.users.stats
+    yield ("bot_user_lookups_total", "counter", "每人限流的結果（allowed / limited / dropped）",
+           [({"result": k}, u[k]) for k in ("allowed", "limited", "dropped")])
+    yield ("bot_queue_shed_per_user_total", "counter", "自己那條 queue 滿了丟掉的事件", [({}, q["shed_per_key"])])
+    yield ("bot_queue_lanes", "gauge", "有事件在排隊的使用者數", [({}, q["lanes"])])
+    yield ("bot_intake_records_total", "counter", "記進今日累計的筆數", [({}, intake.log.stats["records"])])
+
+metrics.register_collector(_collect)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/callback")
 async def callback(req: Request):
     body      = await req.body()
     signature = req.headers.get("X-Line-Signature", "")
     try:
-        events = parser.parse(body.decode(), signature)
+        with metrics.STAGE.time("parse"):
+            events = parser.parse(body.decode(), signature)
     except Exception as e:
+        metrics.EVENTS.inc("webhook", "bad_signature")
         raise HTTPException(400, str(e))
 
-    # 同步處理所有事件
-    await asyncio.gather(*[handle(e) for e in events])
+    # LINE 重送的（同一個 webhookEventId）直接略過，不再查一次、回一次
+    events = await dedupe.seen.drop_duplicates(events)
+
+    # 丟進 queue 就回，不等 Spoonacular / LINE；滿了的事件會被丟掉（見 /stats）
+    for e in events:
+        dispatcher.submit(e)
     return "OK"
 
 # ── 事件分派 ────────────────────────────────────────────────────────────────
+# 從 LINE 送出事件（event.timestamp）起算，整段處理最多 EVENT_BUDGET 秒，
+# queue 裡等的時間也算；回覆本身不在預算內，所以要比 reply token 的時效短一截。
+EVENT_BUDGET = float(os.getenv("EVENT_BUDGET", "20"))
+
 async def handle(event):
+    kind = getattr(getattr(event, "message", None), "type", None) or event.type
     try:
-        if event.message.type == "text":
-            await handle_text(event)
-        elif event.message.type == "image":
-            await handle_image(event)
+        with deadline.scope(EVENT_BUDGET, started_at=event.timestamp / 1000), \
+             ratelimit.users.scope(_user_id(event)), \
+             metrics.IN_FLIGHT.track("events"), metrics.STAGE.time("event"):
+            if kind == "text":
+                await handle_text(event)
+            elif kind == "image":
+                await handle_image(event)
     except ApiException as e:
         # 只簡單印出 LINE 平台回傳的錯誤
+        metrics.EVENTS.inc(kind, "line_error")
         print("[LINE-API]", e.status, e.body)
+    except Exception:
+        metrics.EVENTS.inc(kind, "error")
+        raise
+    else:
+        metrics.EVENTS.inc(kind, "ok")
 
 # ─────────────────────────────────────────────────────────────────────────────
 # async def handle_text(event):
@@ -163,53 +196,168 @@ async def handle(event):
 #     info = await classify_and_lookup(text=msg)
 #     reply = format_nutrition(info) if info else "找不到營養資料 QQ"
 #     await reply_text(event.reply_token, reply)
+def _user_id(event) -> str | None:
+    return getattr(getattr(event, "source", None), "user_id", None)
+
+async def _record(event, info):
+    """查到營養就記進今日累計；回覆送出後才記，不影響回覆速度。"""
+    if (uid := _user_id(event)) and isinstance(info, dict) and "name" in info:
+        await intake.log.record(uid, info, ts=event.timestamp / 1000)
+
 async def handle_text(event):
     msg = event.message.text.strip()
 
+    # 0) 「今天吃了多少」：直接讀累計，不查營養
+    if is_intake_query(msg):
+        await reply_text(event.reply_token, format_intake(await intake.log.today(_user_id(event) or "")))
+        return
+
     # 1) 嘗試先用 TRIGGERS 快速回覆（打招呼、謝謝、早安等）
-    if reply := try_reply(msg):
+    with metrics.STAGE.time("try_reply"):
+        reply = try_reply(msg)
+    if reply:
         await reply_text(event.reply_token, reply)
         return
 
-    # 2) 沒命中關鍵字才查營養
-    info = await classify_and_lookup(text=msg)
+    # 2) 沒命中關鍵字才查營養；快取沒有、要打 Spoonacular 時才扣這個人的額度
+    # Spoonacular 休息中（額度 / 斷路器）就明講
+    try:
+        with metrics.STAGE.time("lookup"):
+            info = await deadline.within(classify_and_lookup(text=msg))
+    except UserLimited:
+        info, reply = None, USER_LIMITED_REPLY
+    except (UpstreamUnavailable, httpx.HTTPError) as e:   # 其他 4xx（金鑰錯之類）也別讓人收不到回覆
+        if not isinstance(e, UpstreamUnavailable):
+            print("[Spoonacular]", type(e).__name__, e, flush=True)
+        info, reply = None, UPSTREAM_DOWN_REPLY
+    except deadline.DeadlineExceeded:   # 查詢還在背景跑完並進快取，下次問就快了
+        info, reply = None, SLOW_REPLY
+    else:
+        reply = NOT_FOUND_REPLY
 
     if isinstance(info, dict) and "name" in info:
         reply = format_nutrition(info)
-    else:
-        reply = "找不到營養資料 QQ"
 
-    await reply_text(event.reply_token, reply)
-
-async def handle_image(event):
-    # 1) 從 LINE 下載原圖
-    url = f"https://api-data.line.me/v2/bot/message/{event.message.id}/content"
+    # 真的查不到：給幾個本機有的相近名稱當按鈕，點了就是快取命中，不用再亂試燒額度
+    choices = None
+    if reply == NOT_FOUND_REPLY:
+        with metrics.STAGE.time("suggest"):
+            choices = nutrition_db.suggest(msg, SUGGEST_K)
+        if choices:
+            reply = SUGGEST_REPLY
+
+    await reply_text(event.reply_token, reply, quick_replies=choices)
+    await _record(event, info)
+
+NOT_FOUND_REPLY = "找不到營養資料 QQ"
+SUGGEST_REPLY   = "找不到營養資料 QQ\n是不是要找下面這些？點一下就好～"
+SUGGEST_K       = int(os.getenv("SUGGEST_K", "4"))      # LINE quick reply 最多 13 個
+
+UPSTREAM_DOWN_REPLY = "查詢服務暫時休息中，晚點再試 QQ"
+SLOW_REPLY          = "這次查太久了，等一下再問一次試試 QQ"
+USER_LIMITED_REPLY  = "你查得有點快，休息一下再繼續問我吧 QQ"
+
+async def reply_limited(event):
+    """自己那條 queue 滿了：不排隊、不查，回罐頭訊息（每人一段時間內只回一次）。"""
+    metrics.EVENTS.inc(getattr(getattr(event, "message", None), "type", None) or event.type,
+                       "limited")
+    if getattr(event, "reply_token", None) and ratelimit.users.notice(_user_id(event)):
+        try:
+            await reply_text(event.reply_token, USER_LIMITED_REPLY)
+        except ApiException as e:
+            print("[LINE-API]", e.status, e.body)
+
+LINE_DATA_HOST = os.getenv("LINE_DATA_HOST", "https://api-data.line.me")
+
+# LINE 原圖大小上限；超過就不下載、不上傳
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+
+class ImageTooLarge(Exception):
+    pass
+
+async def download_image(message_id: str) -> tuple[bytes, str] | None:
+    """
+    串流下載到記憶體（有上限），回 (bytes, content-type)；非 200 回 None。
+    Content-Length 先看一次，超過就不讀 body；沒給長度的邊讀邊算。
+    """
+    url = f"{LINE_DATA_HOST}/v2/bot/message/{message_id}/content"
     headers = {"Authorization": f"Bearer {os.getenv('LINE_CHANNEL_ACCESS_TOKEN')}"}
 
-    async with httpx.AsyncClient(timeout=30) as c:
-        resp = await c.get(url, headers=headers)
-    if resp.status_code != 200:
+    async with http_pool.client("line").stream(
+            "GET", url, headers=headers, timeout=http_pool.timeout(30)) as resp:
+        if resp.status_code != 200:
+            return None
+        if int(resp.headers.get("content-length") or 0) > MAX_IMAGE_BYTES:
+            raise ImageTooLarge
+        buf = bytearray()
+        async for chunk in resp.aiter_bytes():
+            buf += chunk
+            if len(buf) > MAX_IMAGE_BYTES:
+                raise ImageTooLarge
+        return bytes(buf), resp.headers.get("content-type", "image/jpeg")
+
+async def handle_image(event):
+    # 1) 從 LINE 下載原圖（只放記憶體，不寫暫存檔）
+    try:
+        with metrics.STAGE.time("download"):
+            got = await deadline.within(download_image(event.message.id))
+    except ImageTooLarge:
+        await reply_text(event.reply_token, "圖片太大了，傳小一點的試試 QQ")
+        return
+    except (deadline.DeadlineExceeded, httpx.TimeoutException):
+        await reply_text(event.reply_token, SLOW_REPLY)
+        return
+    if got is None:
         await reply_text(event.reply_token, "圖片下載失敗 QQ")
         return
 
-    # 2) 存檔、辨識、查營養
-    with tempfile.NamedTemporaryFile(delete=False) as fp:
-        fp.write(resp.content)
-        img_path = fp.name
-
-    info = await classify_and_lookup(img_path=img_path)
+    # 2) 辨識、查營養
+    image, mime = got
+    try:
+        with metrics.STAGE.time("lookup_image"):
+            info = await deadline.within(classify_and_lookup(image=image, mime=mime))
+    except UserLimited:                 # phash / 本機分類都沒把握，又輪不到上傳（照片多扣一點）
+        await reply_text(event.reply_token, USER_LIMITED_REPLY)
+        return
+    except (UpstreamUnavailable, httpx.HTTPError) as e:
+        if not isinstance(e, UpstreamUnavailable):
+            print("[Spoonacular]", type(e).__name__, e, flush=True)
+        await reply_text(event.reply_token, UPSTREAM_DOWN_REPLY)
+        return
+    except deadline.DeadlineExceeded:
+        await reply_text(event.reply_token, SLOW_REPLY)
+        return
     reply = format_nutrition(info) if info else "這張圖認不出是什麼食物 QQ"
     await reply_text(event.reply_token, reply)
+    await _record(event, info)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-async def reply_text(token: str, text: str):
-    await api.reply_message(
-        ReplyMessageRequest(
-            reply_token=token,
-            messages=[TextMessage(text=text)]
-        )
-    )
+def _quick_reply(choices: list[str] | None) -> QuickReply | None:
+    # 按鈕文字最多 20 字；點下去送出的是完整名稱
+    if not choices:
+        return None
+    return QuickReply(items=[QuickReplyItem(action=MessageAction(label=c[:20], text=c))
+                             for c in choices[:13]])
+
+async def reply_text(token: str, text: str, *, quick_replies: list[str] | None = None):
+    status = "2xx"
+    try:
+        with metrics.STAGE.time("reply"), metrics.IN_FLIGHT.track("line"):
+            await api.reply_message(
+                ReplyMessageRequest(
+                    reply_token=token,
+                    messages=[TextMessage(text=text, quick_reply=_quick_reply(quick_replies))]
+                )
+            )
+    except ApiException as e:
+        status = f"{e.status // 100}xx" if e.status else "error"
+        raise
+    except Exception as e:
+        status = type(e).__name__
+        raise
+    finally:
+        metrics.UPSTREAM_REQUESTS.inc("line", "/v2/bot/message/reply", status)
 
 #===================================================
 # # main.py
@@ -0,0 +1,69 @@
+# meal.py ─────────────────────────────────────────────────────────────
+# 把「雞腿便當+珍奶+2顆茶葉蛋」拆成一項一項，各自帶數量：
+#   [("雞腿便當", 1), ("珍奶", 1), ("茶葉蛋", 2)]
+# 只用符號切（+ 、 , ; 換行），不拿「和 / 跟」切，免得切壞「和風沙拉」；
+# & 和 / 也不切（M&M、1/2）。
+# ----------------------------------------------------------------------
+import re, unicodedata
+
+_SPLIT = re.compile(r"[+、,;\n]+")
+
+_CN_NUM = {"半": 0.5, "一": 1, "兩": 2, "二": 2, "三": 3, "四": 4, "五": 5,
+           "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+_DIGITS = r"\d+(?:\.\d+)?"
+_CN     = r"[半一兩二三四五六七八九十]"
+_NUM    = rf"({_DIGITS}|{_CN})"
+_UNIT   = r"(?:個|顆|份|碗|杯|盤|片|塊|條|根|支|隻|串|包|罐|瓶|粒)"
+
+# 一定要有單位或空白，才不會把「一蘭拉麵」「十全大補湯」「7up」拆掉
+_PREFIX = [
+    re.compile(rf"^({_DIGITS})\s*{_UNIT}\s*(.+)$"),          # 2顆茶葉蛋
+    re.compile(rf"^({_DIGITS})\s+(.+)$"),                    # 3 apples
+]
+# 中文數字 + 單位開頭常常就是菜名（三杯雞、五更腸旺）：
+# 只有一項時要空一格（「兩碗 白飯」）才算數量，跟別的東西一起點（「兩碗白飯+珍奶」）才直接算
+_CN_PREFIX = re.compile(rf"^({_CN})\s*{_UNIT}(\s*)(.+)$")
+_SUFFIX = [
+    re.compile(rf"^(.+?)\s*[x*×]\s*{_NUM}$", re.IGNORECASE), # 茶葉蛋x2 / 茶葉蛋 *2
+    re.compile(rf"^(.+?)\s*{_NUM}\s*{_UNIT}$"),              # 白飯2碗 / 珍奶兩杯
+]
+
+
+def _num(s: str) -> float:
+    return _CN_NUM[s] if s in _CN_NUM else float(s)
+
+
+def _item(part: str, several: bool) -> tuple[str, float] | None:
+    part = part.strip()
+    if not part:
+        return None
+    for rx in _SUFFIX:
+        if (m := rx.match(part)) and m.group(1).strip():
+            return m.group(1).strip(), _num(m.group(2))
+    for rx in _PREFIX:
+        if (m := rx.match(part)) and m.group(2).strip():
+            return m.group(2).strip(), _num(m.group(1))
+    if (m := _CN_PREFIX.match(part)) and m.group(3).strip() and (several or m.group(2)):
+        return m.group(3).strip(), _num(m.group(1))
+    return part, 1
+
+
+def parse_meal(text: str) -> list[tuple[str, float]]:
+    """
+    回 [(食物名稱, 數量), ...]；數量沒寫就是 1。
+
+    >>> parse_meal("雞腿便當+珍奶+2顆茶葉蛋")
+    [('雞腿便當', 1), ('珍奶', 1), ('茶葉蛋', 2.0)]
+    >>> parse_meal("三杯雞"), parse_meal("三杯小卷"), parse_meal("一口酥")
+    ([('三杯雞', 1)], [('三杯小卷', 1)], [('一口酥', 1)])
+    >>> parse_meal("兩碗 白飯"), parse_meal("兩碗白飯、珍奶兩杯")
+    ([('白飯', 2)], [('白飯', 2), ('珍奶', 2)])
+    """
+    text = unicodedata.normalize("NFKC", text)        # 全形＋、，、＊ 先攤平
+    parts = [p for p in _SPLIT.split(text) if p.strip()]
+    return [it for p in parts if (it := _item(p, len(parts) > 1))]
+
+
+def is_meal(items: list[tuple[str, float]]) -> bool:
+    """一項以上、或有寫數量，才當成一餐來算。"""
+    return len(items) > 1 or (len(items) == 1 and items[0][1] != 1)
@@ -0,0 +1,185 @@
+# metrics.py ──────────────────────────────────────────────────────────
+# 極簡 Prometheus 指標（text exposition format 0.0.4），不用裝 prometheus_client。
+# 熱路徑上只有「加一個數字」：Counter.inc、Gauge.inc/dec、Histogram.observe
+# 都是 dict 查找 + 加法；字串組裝只在 /metrics 被抓的時候才做。
+# 其他模組原本就有的 stats dict（快取、queue、斷路器…）用 collector 在抓的當下讀，
+# 不在熱路徑上重複記一次。
+#
+#   with metrics.STAGE.time("lookup"):
+#       info = await classify_and_lookup(text=msg)
+#   metrics.UPSTREAM_REQUESTS.inc("spoonacular", "/recipes/guessNutrition", "2xx")
+# ----------------------------------------------------------------------
+import bisect, math, re, time
+from typing import Callable, Iterable
+
+_metrics: list["_Metric"] = []
+_collectors: list[Callable[[], Iterable[tuple]]] = []
+
+
+def _esc(v) -> str:
+    return str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _fmt_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        _metrics.append(self)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return self._header() + [f"{self.name}{_fmt_labels(self.labels, k)} {_num(v)}"
+                                 for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, *labels, value: float):
+        self._values[labels] = value
+
+    def track(self, *labels) -> "_InFlight":
+        """with GAUGE.track("x"): 進去 +1、出來 -1（in-flight 數）。"""
+        return _InFlight(self, labels)
+
+
+class _InFlight:
+    __slots__ = ("g", "labels")
+
+    def __init__(self, g: Gauge, labels: tuple):
+        self.g, self.labels = g, labels
+
+    def __enter__(self):
+        self.g.inc(*self.labels)
+
+    def __exit__(self, *exc):
+        self.g.dec(*self.labels)
+
+
+# 秒；涵蓋快取命中（微秒級）到 Spoonacular 逾時（十幾秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}      # labels → [各桶次數..., +Inf 桶, sum]
+
+    def observe(self, value: float, *labels):
+        s = self._series.get(labels)
+        if s is None:
+            s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        s[bisect.bisect_left(self.buckets, value)] += 1
+        s[-1] += value
+
+    def time(self, *labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        out = self._header()
+        for labels, s in self._series.items():
+            acc = 0
+            for le, n in zip(self.buckets + (math.inf,), s[:-1]):
+                acc += n
+                le = 'le="%s"' % _num(le)
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, labels, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, labels)} {_num(s[-1])}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, labels)} {acc}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("h", "labels", "t0")
+
+    def __init__(self, h: Histogram, labels: tuple):
+        self.h, self.labels = h, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.h.observe(time.perf_counter() - self.t0, *self.labels)
+
+
+# ── 抓的當下才讀的指標 ────────────────────────────────────────────────
+def register_collector(fn: Callable[[], Iterable[tuple]]):
+    """
+    fn() 回 (name, kind, help, [(labels dict, value), ...]) 的序列，
+    每次 /metrics 被抓才呼叫。
+    """
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines: list[str] = []
+    for m in _metrics:
+        lines += m.render()
+    for fn in _collectors:
+        try:
+            families = list(fn())
+        except Exception as e:               # 一個 collector 壞掉不能拖垮整頁
+            print("[metrics] collector 失敗", fn, e, flush=True)
+            continue
+        for name, kind, help, samples in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"{name}{_fmt_labels(tuple(labels), tuple(labels.values()))} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+
+_ID = re.compile(r"/\d+(?=/|$)")
+
+def endpoint(url) -> str:
+    """URL → 不帶 query、數字 id 換成 {id} 的路徑，當 label 才不會爆量。"""
+    path = getattr(url, "path", None) or str(url).split("?", 1)[0].split("://", 1)[-1]
+    if "/" in path and not path.startswith("/"):
+        path = path[path.index("/"):]
+    return _ID.sub("/{id}", path)
+
+
+# ── 全 app 共用的指標 ─────────────────────────────────────────────────
+STAGE = Histogram("bot_stage_seconds",
+                  "各階段耗時（parse / try_reply / cache / lookup / suggest / download / classify / reply / event）",
+                  ("stage",))
+EVENTS = Counter("bot_events_total", "處理完的 LINE 事件", ("type", "outcome"))
+IN_FLIGHT = Gauge("bot_in_flight", "正在處理的事件 / 上游請求", ("what",))
+UPSTREAM_REQUESTS = Counter("bot_upstream_requests_total", "打上游的次數",
+                            ("host", "endpoint", "status"))
+UPSTREAM_LATENCY  = Histogram("bot_upstream_seconds", "上游回應時間", ("host", "endpoint"))
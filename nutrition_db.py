@@ -1,43 +1,153 @@
-import os, pathlib, re, pandas as pd, httpx
+import asyncio, os, pathlib, threading
 from dotenv import load_dotenv
 load_dotenv()
 
-CSV = pathlib.Path(__file__).with_name("nutrition.csv")
-CSV.touch(exist_ok=True)
+from textnorm import norm_name
+from nutrition_store import CsvStore, SqliteStore, FIELDS
+import colstore
+import http_pool
+from deadline  import DeadlineExceeded
+from ratelimit import spoonacular, UpstreamUnavailable
+from suggest   import Suggester
 
-if CSV.stat().st_size == 0:          # 建欄位
-    pd.DataFrame(columns=["name", "kcal", "protein", "fat", "carb"]).to_csv(CSV, index=False)
+CSV = pathlib.Path(os.getenv("NUTRITION_CSV", pathlib.Path(__file__).with_name("nutrition.csv")))
 
-df = pd.read_csv(CSV)                # 讀快取
+# 唯讀底層：大張離線食物表轉成的 nutrition.col（python colstore.py nutrition.csv），
+# 只 mmap 不解析；沒有這個檔就只用 CSV 快取
+COLSTORE = pathlib.Path(os.getenv("NUTRITION_COLSTORE", CSV.with_suffix(".col")))
+
+# import 時不碰磁碟：第一次查詢或 lifespan 的 warm_up() 才讀，冷啟動快
+store = None
+base  = None
+_load_lock = threading.Lock()
+
+def load():
+    """讀 CSV 快取、開 nutrition.col、建索引；做過就不再做。"""
+    global store, base
+    with _load_lock:
+        if store is not None:
+            return
+        CSV.touch(exist_ok=True)
+        if CSV.stat().st_size == 0:          # 建欄位
+            CSV.write_text(",".join(FIELDS) + "\n", encoding="utf-8")
+
+        # 單一 process：CSV snapshot + append-only log
+        # 多 worker（uvicorn --workers N）：NUTRITION_STORE=sqlite，大家共用一個 WAL 資料庫
+        if os.getenv("NUTRITION_STORE", "csv") == "sqlite":
+            s = SqliteStore(os.getenv("NUTRITION_SQLITE", CSV.with_suffix(".sqlite3")),
+                            seed_csv=CSV)
+        else:
+            s = CsvStore(CSV)                # 見 nutrition_store.py
+        s.load()                             # 讀快取
+        base = colstore.open_if_exists(COLSTORE)
+        _rebuild_index(s.rows)
+        store = s                            # 最後才設，別的 thread 看到就是建好的
+
+async def warm_up():
+    await asyncio.to_thread(load)
+
+def ready() -> bool:
+    return store is not None
 
 # ---------- 工具 ----------
-_norm = lambda s: re.sub(r"[^a-z]", "", s.lower())
+_norm = norm_name                    # 懂中文 / 全半形 / 繁簡，見 textnorm.py
+
+# 正規化名稱 → 營養 dict；載入時建一次、每次寫入時順手更新，查詢 O(1)
+_index: dict[str, dict] = {}
+
+def _num(v) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _row_to_info(r: dict) -> dict:
+    return dict(name=r["name"], calories=_num(r["kcal"]), protein=_num(r["protein"]),
+                fat=_num(r["fat"]), carbs=_num(r["carb"]))
+
+# 同一批名稱（含使用者打的中文 alias）的 trie + 錯字索引，查不到時給建議用
+names = Suggester()
+
+def _index_row(info: dict):
+    # 同名以第一筆為準（跟舊版 iloc[0] 行為一致）；全是標點的名字不收
+    if (key := _norm(info["name"])) and key not in _index:
+        _index[key] = info
+        names.add(key, info["name"])
+
+def _rebuild_index(rows: list[dict]):
+    _index.clear()
+    names.clear()
+    for r in rows:
+        _index_row(_row_to_info(r))
 
 def lookup_food(name: str):
-    row = df[df["name"].apply(_norm) == _norm(name)]
-    if row.empty:
+    if not name:
         return None
-    r = row.iloc[0]
-    return dict(name=r["name"], calories=r["kcal"], protein=r["protein"], fat=r["fat"], carbs=r["carb"])
+    if store is None:
+        load()
+    key  = _norm(name)
+    info = _index.get(key)
+    if info is None and base is not None and (info := base.get_key(key)):
+        return info
+    if info is None and (new := store.refresh()):   # 別的 worker 剛寫進來的
+        for r in new:
+            _index_row(_row_to_info(r))
+        info = _index.get(key)
+    return dict(info) if info else None
+
+def add_food(info: dict, alias: str | None = None):
+    """
+    寫回快取；Spoonacular 回的常是英文名，使用者打的中文名（alias）也記一筆，
+    下次同一道菜才查得到、不用再打 API。已經有的 key 不重複寫。
+    """
+    if store is None:
+        load()
+    rows = [info]
+    if alias:
+        rows.append(dict(info, name=alias))
+    for r in rows:
+        key = _norm(r["name"])
+        if not key or key in _index or (base is not None and key in base):
+            continue
+        store.append({"name": r["name"], "kcal": r["calories"],
+                      "protein": r["protein"], "fat": r["fat"], "carb": r["carbs"]})
+        _index_row(r)
+
+def suggest(name: str, k: int = 4) -> list[str]:
+    """
+    查不到時「你是不是要找…」：快取裡的名稱（錯字 / 前綴）不夠再用 nutrition.col 的前綴補。
+    全在記憶體 / mmap 裡做，不打網路。
+    """
+    if store is None:
+        load()
+    key = _norm(name)
+    out = names.suggest(key, k)
+    if len(out) < k and base is not None and key:
+        out += [n for n in base.prefix(key, k) if n not in out][:k - len(out)]
+    return out
 
 # ---------- Spoonacular ----------
-_API1 = "https://api.spoonacular.com/food/ingredients/search"
-_API2 = "https://api.spoonacular.com/food/ingredients/{id}/information"
+_BASE = os.getenv("SPOONACULAR_BASE", "https://api.spoonacular.com")
+_API1 = _BASE + "/food/ingredients/search"
+_API2 = _BASE + "/food/ingredients/{id}/information"
 _KEY  = os.getenv("SPOONACULAR_API_KEY", "")
 
 async def fetch_nutrition(name: str):
     if not _KEY:
         return None
-    async with httpx.AsyncClient(timeout=10) as cli:
-        try:
-            q = {"query": name, "number": 1, "apiKey": _KEY}
-            r = await cli.get(_API1, params=q); r.raise_for_status()
-            items = r.json()["results"];  iid = items[0]["id"]
-            r = await cli.get(_API2.format(id=iid), params={"amount": 100, "unit": "g", "apiKey": _KEY})
-            r.raise_for_status(); info = r.json()
-        except Exception as e:
-            print("[Spoonacular error]", e, flush=True)
-            return None
+    to = http_pool.timeout(10)
+    try:
+        q = {"query": name, "number": 1, "apiKey": _KEY}
+        r = await spoonacular.request("GET", _API1, params=q, timeout=to); r.raise_for_status()
+        items = r.json()["results"];  iid = items[0]["id"]
+        r = await spoonacular.request("GET", _API2.format(id=iid),
+                                      params={"amount": 100, "unit": "g", "apiKey": _KEY}, timeout=to)
+        r.raise_for_status(); info = r.json()
+    except (UpstreamUnavailable, DeadlineExceeded):   # 斷路器開著 / 沒時間了：呼叫端自己降級
+        raise
+    except Exception as e:
+        print("[Spoonacular error]", e, flush=True)
+        return None
 
     nutr = {n["name"]: n["amount"] for n in info["nutrition"]["nutrients"]}
     data = dict(
@@ -47,12 +157,5 @@ async def fetch_nutrition(name: str):
         fat       = round(nutr.get("Fat",             0), 1),
         carbs     = round(nutr.get("Carbohydrates",   0), 1),
     )
-
-    # 寫回快取
-    global df
-    df = pd.concat([df, pd.DataFrame([{
-        "name": data["name"], "kcal": data["calories"],
-        "protein": data["protein"], "fat": data["fat"], "carb": data["carbs"]
-    }])], ignore_index=True)
-    df.to_csv(CSV, index=False)
+    add_food(data, alias=name)
     return data
@@ -0,0 +1,336 @@
+# nutrition_store.py ──────────────────────────────────────────────────
+# nutrition.csv 的持久層：snapshot + append-only log。
+#   nutrition.csv      ← snapshot（壓實後的完整表，原子替換）
+#   nutrition.csv.log  ← 新增的列一行一行往後接，不重寫整個檔
+# 寫入只是丟進 queue（O(1)、不碰磁碟），背景 thread 批次寫 + fsync，
+# log 累積夠多就在背景壓實回 snapshot。
+# 寫失敗（磁碟滿、fsync 錯、database is locked）只印出來，那批留著過一下再寫，
+# 背景 thread 不能因為一次錯誤就死掉、之後的列全部默默丟掉。
+# ----------------------------------------------------------------------
+import csv, io, os, pathlib, queue, threading, time, atexit
+
+FIELDS = ["name", "kcal", "protein", "fat", "carb"]
+RETRY_INTERVAL = 5.0                  # 寫失敗後隔幾秒再試
+
+
+class CsvStore:
+    def __init__(self, path: pathlib.Path, *,
+                 flush_every: int = 64,          # 累積幾列就 fsync
+                 flush_interval: float = 1.0,    # 或最多等幾秒就 fsync
+                 compact_every: int = 5000):     # log 超過幾列就壓實
+        self.path     = pathlib.Path(path)
+        self.log_path = self.path.with_name(self.path.name + ".log")
+        self.flush_every    = flush_every
+        self.flush_interval = flush_interval
+        self.compact_every  = compact_every
+
+        self.fields: list[str] = list(FIELDS)
+        self.rows:   list[dict] = []
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._written  = 0            # rows[:_written] 已經落地（snapshot + log）
+        self._log_rows = 0
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    # ── 讀 ─────────────────────────────────────────────────────────
+    def load(self, readonly: bool = False) -> list[dict]:
+        """讀 snapshot 再重播 log；log 最後一行沒換行代表寫到一半當機，丟掉。
+        readonly=True 只讀（給 SqliteStore 搬資料用），不截檔也不開寫入 thread。"""
+        self.rows = []
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, newline="", encoding="utf-8") as fp:
+                rd = csv.DictReader(fp)
+                self.fields = rd.fieldnames or self.fields
+                self.rows.extend(rd)
+
+        self._log_rows = 0
+        if self.log_path.exists():
+            text  = self.log_path.read_text(encoding="utf-8")
+            lines = text.split("\n")[:-1]        # 最後一段沒有 \n → 不完整
+            if not text.endswith("\n") and text and not readonly:
+                # 截掉半行，不然下一筆會接在它後面
+                tail = text.rsplit("\n", 1)[-1]
+                with open(self.log_path, "r+b") as fp:
+                    fp.truncate(len(text.encode()) - len(tail.encode()))
+            for rec in csv.reader(lines):
+                if len(rec) == len(self.fields):
+                    self.rows.append(dict(zip(self.fields, rec)))
+                    self._log_rows += 1
+
+        self._written = len(self.rows)
+        if not readonly:
+            self._start()
+        return self.rows
+
+    def refresh(self) -> list[dict]:
+        """單一 process 獨佔 CSV，不會有別人寫進來。"""
+        return []
+
+    # ── 寫 ─────────────────────────────────────────────────────────
+    def append(self, row: dict):
+        """O(1)：記到記憶體、排進背景寫入，不等磁碟。"""
+        self.rows.append(row)
+        self._q.put(row)
+
+    def flush(self, timeout: float = 5.0):
+        """等背景 thread 把目前排隊的列都寫完並 fsync（測試 / 關機用）。"""
+        done = threading.Event()
+        self._q.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._closed or not self._thread:
+            return
+        self._closed = True
+        self._q.put(None)
+        self._thread.join(timeout=10)
+
+    # ── 背景寫入 ───────────────────────────────────────────────────
+    def _start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="nutrition-store",
+                                        daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        batch: list[dict] = []
+        last_sync = time.monotonic()
+        retry_at = compact_at = 0.0
+        while True:
+            try:
+                item = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ...
+            if isinstance(item, dict):
+                batch.append(item)
+                if len(batch) < self.flush_every and \
+                   time.monotonic() - last_sync < self.flush_interval:
+                    continue
+            urgent = item is None or isinstance(item, threading.Event)
+            if batch and (urgent or time.monotonic() >= retry_at):
+                if self._append_log(batch):
+                    self._written  += len(batch)
+                    self._log_rows += len(batch)
+                    batch, retry_at = [], 0.0
+                else:                                # 留著這批，等一下再寫
+                    retry_at = time.monotonic() + RETRY_INTERVAL
+                last_sync = time.monotonic()
+            if not batch and self._log_rows >= self.compact_every and time.monotonic() >= compact_at:
+                try:
+                    self._compact()
+                except OSError as e:
+                    print("[nutrition-store] 壓實失敗，晚點再試", e, flush=True)
+                    compact_at = time.monotonic() + RETRY_INTERVAL * 12
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                if batch:
+                    print("[nutrition-store] 關機時還有", len(batch), "列沒寫進去", flush=True)
+                break
+
+    def _append_log(self, batch: list[dict]) -> bool:
+        """一批接到 log 後面並 fsync；失敗就把寫了一半的截掉，回 False。"""
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerows(
+            [r.get(f, "") for f in self.fields] for r in batch)
+        data = buf.getvalue().encode("utf-8")
+        try:
+            with open(self.log_path, "ab") as fp:
+                start = fp.tell()
+                try:
+                    fp.write(data)
+                    fp.flush(); os.fsync(fp.fileno())
+                except OSError:
+                    try:
+                        fp.truncate(start)
+                    except OSError:
+                        pass
+                    raise
+        except OSError as e:
+            print("[nutrition-store] 寫入失敗，", len(batch), "列晚點重試：", e, flush=True)
+            return False
+        return True
+
+    def _compact(self):
+        """rows[:_written] 寫成新 snapshot → 原子替換 → 清空 log。"""
+        rows = self.rows[:self._written]
+        tmp  = self.path.with_name(self.path.name + ".tmp")
+        buf  = io.StringIO()
+        wr   = csv.DictWriter(buf, fieldnames=self.fields, restval="",
+                              extrasaction="ignore", lineterminator="\n")
+        wr.writeheader()
+        seen = set()                  # 替換後、清 log 前當機會重播重複列，這裡順便去掉
+        for r in rows:
+            key = tuple(str(r.get(f, "")) for f in self.fields)
+            if key not in seen:
+                seen.add(key)
+                wr.writerow(r)
+        with open(tmp, "w", newline="", encoding="utf-8") as fp:
+            fp.write(buf.getvalue())
+            fp.flush(); os.fsync(fp.fileno())
+        os.replace(tmp, self.path)
+        with open(self.log_path, "w"):
+            pass
+        self._log_rows = 0
+
+
+# ── 多 worker 共用：SQLite（WAL）──────────────────────────────────────
+# uvicorn --workers N 時每個 worker 各有一份記憶體索引，但都寫同一個 .sqlite3：
+#   - WAL 模式：讀不擋寫、寫不擋讀，多個 process 同時開沒問題
+#   - key（正規化名稱）UNIQUE：兩個 worker 同時寫同一道菜也只會留一筆
+#   - refresh()：看 PRAGMA data_version 有沒有變，有才把別人新寫的列拉進來
+class SqliteStore:
+    def __init__(self, path: pathlib.Path, *,
+                 seed_csv: pathlib.Path | None = None,   # 第一次建表時匯入
+                 flush_every: int = 64,
+                 flush_interval: float = 0.2):
+        self.path = pathlib.Path(path)
+        self.seed_csv = seed_csv
+        self.flush_every    = flush_every
+        self.flush_interval = flush_interval
+
+        self.fields: list[str] = list(FIELDS)
+        self.rows:   list[dict] = []
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._db = None                   # event loop 這邊讀用
+        self._last_id = 0
+        self._version = None
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def _connect(self):
+        import sqlite3
+        # load() 在 warm-up 的 thread 開連線，之後 refresh() 在 event loop 用；
+        # 同一時間只有一邊在用，所以關掉 sqlite3 的同 thread 檢查
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                             check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")     # WAL 下 commit 只在 checkpoint fsync
+        return db
+
+    # ── 讀 ─────────────────────────────────────────────────────────
+    def load(self) -> list[dict]:
+        from textnorm import norm_name
+        self._db = db = self._connect()
+        db.execute("""CREATE TABLE IF NOT EXISTS foods (
+                        id      INTEGER PRIMARY KEY,
+                        key     TEXT UNIQUE NOT NULL,
+                        name    TEXT NOT NULL,
+                        kcal REAL, protein REAL, fat REAL, carb REAL)""")
+
+        # 舊的 nutrition.csv 搬進來；BEGIN IMMEDIATE 讓多個 worker 只有一個做
+        if self.seed_csv and self.seed_csv.exists():
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if db.execute("SELECT 1 FROM foods LIMIT 1").fetchone() is None:
+                    db.executemany(
+                        "INSERT OR IGNORE INTO foods(key,name,kcal,protein,fat,carb) "
+                        "VALUES (?,?,?,?,?,?)",
+                        [(norm_name(r["name"]), r["name"], r.get("kcal"), r.get("protein"),
+                          r.get("fat"), r.get("carb"))
+                         for r in CsvStore(self.seed_csv).load(readonly=True)
+                         if norm_name(r["name"])])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+        self.rows = []
+        self.refresh()
+        self._start()
+        return self.rows
+
+    def refresh(self) -> list[dict]:
+        """別的 worker 有寫入才去撈新列；沒變化時只是一個 PRAGMA。"""
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._version:
+            return []
+        self._version = version
+        cur = self._db.execute(
+            "SELECT id,name,kcal,protein,fat,carb FROM foods WHERE id > ? ORDER BY id",
+            (self._last_id,))
+        new = []
+        for rid, *vals in cur:
+            self._last_id = rid
+            new.append(dict(zip(self.fields, vals)))
+        self.rows.extend(new)
+        return new
+
+    # ── 寫 ─────────────────────────────────────────────────────────
+    def append(self, row: dict):
+        """O(1)：排進背景寫入。寫進去之後 refresh() 會跟別人寫的一起讀回 rows。"""
+        self._q.put(row)
+
+    def flush(self, timeout: float = 5.0):
+        done = threading.Event()
+        self._q.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._closed or not self._thread:
+            return
+        self._closed = True
+        self._q.put(None)
+        self._thread.join(timeout=10)
+
+    def _start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="nutrition-sqlite",
+                                        daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        import sqlite3
+        db = None                           # 寫入 thread 自己一條連線
+        batch: list[dict] = []
+        retry_at = 0.0
+        try:
+            while True:
+                try:
+                    item = self._q.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = ...
+                if isinstance(item, dict):
+                    batch.append(item)
+                    if len(batch) < self.flush_every:
+                        continue
+                urgent = item is None or isinstance(item, threading.Event)
+                if batch and (urgent or time.monotonic() >= retry_at):
+                    try:
+                        db = db or self._connect()
+                        self._insert(db, batch)
+                        batch, retry_at = [], 0.0
+                    except sqlite3.Error as e:       # database is locked、磁碟滿…：留著這批再試
+                        print("[nutrition-sqlite] 寫入失敗，", len(batch), "列晚點重試：", e, flush=True)
+                        retry_at = time.monotonic() + RETRY_INTERVAL
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is None:
+                    if batch:
+                        print("[nutrition-sqlite] 關機時還有", len(batch), "列沒寫進去", flush=True)
+                    break
+        finally:
+            if db is not None:
+                db.close()
+
+    def _insert(self, db, batch: list[dict]):
+        """一批一個 transaction；同 key 已經有人寫過就略過。失敗整批 rollback。"""
+        from textnorm import norm_name
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT OR IGNORE INTO foods(key,name,kcal,protein,fat,carb) "
+                "VALUES (?,?,?,?,?,?)",
+                [(norm_name(r["name"]), r["name"], r.get("kcal"), r.get("protein"),
+                  r.get("fat"), r.get("carb")) for r in batch])
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
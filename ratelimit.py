@@ -0,0 +1,306 @@
+# ratelimit.py ────────────────────────────────────────────────────────
+# Spoonacular 的總閘門，所有打 Spoonacular 的地方都經過這裡：
+#   1) 斷路器：402（今日點數用完）、429、連續逾時 / 5xx 就先「跳電」，
+#      期間直接丟 UpstreamUnavailable，不再白打一趟
+#   2) 每日點數：從回應 header（X-API-Quota-Left / -Used）追蹤剩多少
+#   3) token bucket：把請求速率抹平，不要一瞬間全衝出去被 429
+# 402 / 429 / 5xx、連不上也是丟 UpstreamUnavailable（觸發跳電的那個請求也一樣），
+# 呼叫端接到 UpstreamUnavailable 就走快取 / 降級回覆。
+# 另外 PerUserLimiter 是每個 LINE 使用者各一個 bucket，只在真的要打 Spoonacular 時才扣：
+# main.handle 用 users.scope(userId) 標記這個事件是誰的，Guard.request 出門前扣那個人的，
+# 扣不到就丟 UserLimited（合併成一個 flight 的查詢：每個呼叫者加入前各扣各的）。
+# 快取 / 本機資料 / phash 答得出來的不算，
+# 一個人狂丟照片不會把大家的點數用光，查過的東西（含建議按鈕）照樣秒回。
+# ----------------------------------------------------------------------
+import asyncio, contextlib, contextvars, datetime as dt, heapq, os, time
+from collections import OrderedDict
+import httpx
+import deadline, http_pool, metrics
+
+
+class UpstreamUnavailable(Exception):
+    """上游目前不能用（斷路器打開、點數用完、排隊太久）。"""
+
+
+class UserLimited(UpstreamUnavailable):
+    """這個使用者查太兇了；上游本身沒事，別人照常（呼叫端的降級路一樣走得通）。"""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate   = rate
+        self.burst  = burst
+        self.tokens = float(burst)
+        self._t     = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def try_take(self, cost: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    async def take(self, max_wait: float) -> bool:
+        """等到有 token；要等超過 max_wait 就放棄回 False。"""
+        deadline = time.monotonic() + max_wait
+        while not self.try_take():
+            wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    """closed → (連續失敗 / 402 / 429) → open → 冷卻到期 → half_open 放一個試 → closed"""
+
+    def __init__(self, fail_threshold: int = 5, cooldown: float = 30):
+        self.fail_threshold = fail_threshold
+        self.cooldown       = cooldown
+        self.state    = "closed"
+        self.failures = 0
+        self.open_until = 0.0             # time.time()
+        self.reason   = ""
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.time() < self.open_until:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:              # 半開時只放一個請求去試
+                return False
+            self._probing = True
+        return True
+
+    def release(self):
+        """放出去試的那個請求沒有結果（被取消、沒排到）就讓下一個再試。"""
+        self._probing = False
+
+    def success(self):
+        self.state, self.failures, self._probing, self.reason = "closed", 0, False, ""
+
+    def failure(self, reason: str):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.fail_threshold:
+            self.trip(self.cooldown, reason)
+
+    def trip(self, seconds: float, reason: str):
+        self.state, self.reason = "open", reason
+        self.open_until = time.time() + seconds
+        self._probing = False
+        print(f"[breaker] 跳開 {seconds:.0f}s：{reason}", flush=True)
+
+
+def _seconds_to_utc_midnight() -> float:
+    """Spoonacular 每日點數在 UTC 午夜重置。"""
+    now = dt.datetime.now(dt.timezone.utc)
+    tomorrow = (now + dt.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+class Guard:
+    def __init__(self, host: str, *, rate: float, burst: int, max_wait: float,
+                 fail_threshold: int, cooldown: float, quota_reserve: float,
+                 users: "PerUserLimiter | None" = None):
+        self.host     = host
+        self.users    = users                       # 每人限流；出門前扣 users.scope() 標記的那個人
+        self.bucket   = TokenBucket(rate, burst)
+        self.breaker  = CircuitBreaker(fail_threshold, cooldown)
+        self.max_wait = max_wait
+        self.quota_reserve = quota_reserve          # 剩這麼多點就先停，留給重要請求
+        self.quota = {"left": None, "used": None, "last_request": None}
+        self.stats = {"requests": 0, "short_circuited": 0, "throttled": 0,
+                      "http_402": 0, "http_429": 0, "errors": 0}
+
+    def charge_user(self, url: str, cost: float = 1):
+        """扣目前 users.scope() 那個人的；扣不到丟 UserLimited。"""
+        if self.users and not self.users.charge(cost):
+            metrics.UPSTREAM_REQUESTS.inc(self.host, metrics.endpoint(url), "user_limited")
+            raise UserLimited(f"{self.host} per-user limit")
+
+    async def request(self, method: str, url: str, *, user_cost: float = 1,
+                      **kw) -> httpx.Response:
+        ep = metrics.endpoint(url)
+        self.charge_user(url, user_cost)          # 先扣人，不佔斷路器的試探名額
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            metrics.UPSTREAM_REQUESTS.inc(self.host, ep, "short_circuited")
+            raise UpstreamUnavailable(f"{self.host} breaker open: {self.breaker.reason}")
+        try:
+            if not await self.bucket.take(min(self.max_wait, deadline.remaining())):
+                self.stats["throttled"] += 1
+                metrics.UPSTREAM_REQUESTS.inc(self.host, ep, "throttled")
+                raise UpstreamUnavailable(f"{self.host} rate limited")
+            self.stats["requests"] += 1
+            with metrics.IN_FLIGHT.track(self.host), metrics.UPSTREAM_LATENCY.time(self.host, ep):
+                r = await http_pool.client(self.host).request(method, url, **kw)
+        except httpx.TransportError as e:          # 逾時、連不上
+            metrics.UPSTREAM_REQUESTS.inc(self.host, ep, type(e).__name__)
+            if isinstance(e, httpx.TimeoutException) and deadline.expired():
+                self.breaker.release()             # 是這個事件自己沒時間了，不算上游的錯
+                raise deadline.DeadlineExceeded from e
+            self.stats["errors"] += 1
+            self.breaker.failure(type(e).__name__)
+            raise UpstreamUnavailable(f"{self.host} {type(e).__name__}: {e}") from e
+        except BaseException:
+            self.breaker.release()
+            raise
+        self._track_quota(r)
+        metrics.UPSTREAM_REQUESTS.inc(self.host, ep, f"{r.status_code // 100}xx")
+
+        if r.status_code == 402:                   # 今日點數用完，等到 UTC 午夜
+            self.stats["http_402"] += 1
+            self.breaker.trip(_seconds_to_utc_midnight(), "daily quota exhausted (402)")
+        elif r.status_code == 429:
+            self.stats["http_429"] += 1
+            retry = r.headers.get("retry-after", "")
+            self.breaker.trip(float(retry) if retry.isdigit() else self.breaker.cooldown,
+                              "rate limited (429)")
+        elif r.status_code >= 500:
+            self.stats["errors"] += 1
+            self.breaker.failure(f"HTTP {r.status_code}")
+        else:
+            self.breaker.success()
+            left = self.quota["left"]
+            if left is not None and left <= self.quota_reserve:
+                self.breaker.trip(_seconds_to_utc_midnight(), f"quota left {left:g}")
+            return r
+        # 402 / 429 / 5xx：這一個請求也算上游不能用，呼叫端走同一條降級路
+        raise UpstreamUnavailable(f"{self.host} HTTP {r.status_code}")
+
+    def _track_quota(self, r: httpx.Response):
+        for key, header in (("left", "x-api-quota-left"), ("used", "x-api-quota-used"),
+                            ("last_request", "x-api-quota-request")):
+            if (v := r.headers.get(header)) is not None:
+                try:
+                    self.quota[key] = float(v)
+                except ValueError:
+                    pass
+
+    def snapshot(self) -> dict:
+        b = self.breaker
+        return dict(self.stats,
+                    breaker    = b.state,
+                    breaker_reason = b.reason,
+                    open_for_s = max(0.0, round(b.open_until - time.time(), 1)) if b.state == "open" else 0.0,
+                    tokens     = round(self.bucket.tokens, 2),
+                    quota      = dict(self.quota))
+
+
+# 這個事件是誰的（LINE userId）；main.handle 設、Guard.request 讀
+_user: contextvars.ContextVar[str | None] = contextvars.ContextVar("ratelimit_user", default=None)
+
+
+class PerUserLimiter:
+    """
+    每個 key（LINE userId）一個 TokenBucket，拿不到 token 就不打上游、直接回罐頭訊息。
+    只留最近 max_users 個人（LRU）；被擠掉的人下次回來 bucket 是滿的，
+    反正擠掉的就是最久沒出現的。
+    """
+
+    def __init__(self, *, rate: float, burst: int, max_users: int = 10_000,
+                 notice_interval: float = 30):
+        self.rate, self.burst, self.max_users = rate, burst, max_users
+        self.notice_interval = notice_interval
+        self._users: OrderedDict[str, dict] = OrderedDict()   # key → bucket + 計數
+        self.stats = {"allowed": 0, "limited": 0, "dropped": 0, "evictions": 0}
+
+    def _entry(self, key: str) -> dict:
+        e = self._users.get(key)
+        if e is None:
+            e = self._users[key] = {"bucket": TokenBucket(self.rate, self.burst),
+                                    "allowed": 0, "limited": 0, "dropped": 0, "noticed": 0.0}
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.stats["evictions"] += 1
+        else:
+            self._users.move_to_end(key)
+        return e
+
+    def allow(self, key: str | None, cost: float = 1) -> bool:
+        """不等待；沒有 key（群組裡看不到 userId 之類）就不限。"""
+        if key is None or self.rate <= 0:
+            return True
+        e = self._entry(key)
+        ok = e["bucket"].try_take(cost)
+        e["allowed" if ok else "limited"] += 1
+        self.stats["allowed" if ok else "limited"] += 1
+        return ok
+
+    @contextlib.contextmanager
+    def scope(self, key: str | None):
+        """這段裡（含它開的 task）打上游都算 key 的。"""
+        token = _user.set(key)
+        try:
+            yield
+        finally:
+            _user.reset(token)
+
+    def detach(self):
+        """
+        在共用的背景 task 裡呼叫（singleflight）：之後打上游不算任何人的，
+        每個呼叫者在加入前自己扣（task 建立時複製了 context，改這裡不影響原本的事件）。
+        """
+        _user.set(None)
+
+    def charge(self, cost: float = 1) -> bool:
+        """扣目前 scope 那個人的；沒在 scope 裡（benchmark、背景工作）就不限。"""
+        return self.allow(_user.get(), cost)
+
+    def notice(self, key: str | None) -> bool:
+        """
+        排不進 queue 的事件：notice_interval 內只回一次「查太快了」，
+        其他的直接丟（一直狂丟的人不需要收到一百次同一句）。
+        """
+        if key is None:
+            return True
+        e, now = self._entry(key), time.monotonic()
+        if now - e["noticed"] >= self.notice_interval:
+            e["noticed"] = now
+            return True
+        e["dropped"] += 1
+        self.stats["dropped"] += 1
+        return False
+
+    def user(self, key: str) -> dict | None:
+        e = self._users.get(key)
+        if e is None:
+            return None
+        e["bucket"]._refill()
+        return {"allowed": e["allowed"], "limited": e["limited"], "dropped": e["dropped"],
+                "tokens": round(e["bucket"].tokens, 2)}
+
+    def snapshot(self, top: int = 10) -> dict:
+        noisy = heapq.nlargest(top, self._users.items(),
+                               key=lambda kv: kv[1]["limited"] + kv[1]["dropped"])
+        return dict(self.stats, users=len(self._users), rate=self.rate, burst=self.burst,
+                    most_limited={k: self.user(k) for k, e in noisy if e["limited"] + e["dropped"]})
+
+
+# 每人每分鐘幾次上游查詢；照片上傳比文字貴，多扣一點
+users = PerUserLimiter(
+    rate      = float(os.getenv("USER_LOOKUPS_PER_MIN", "12")) / 60,
+    burst     = int(os.getenv("USER_LOOKUP_BURST",      "6")),
+    max_users = int(os.getenv("USER_LIMITER_MAX_USERS", "10000")),
+    notice_interval = float(os.getenv("USER_LIMIT_NOTICE_INTERVAL", "30")),
+)
+IMAGE_COST = float(os.getenv("USER_IMAGE_COST", "2"))
+
+spoonacular = Guard(
+    "spoonacular",
+    rate           = float(os.getenv("SPOON_RPS",            "2")),
+    burst          = int(os.getenv("SPOON_BURST",            "5")),
+    max_wait       = float(os.getenv("SPOON_MAX_WAIT",       "3")),
+    fail_threshold = int(os.getenv("SPOON_BREAKER_FAILS",    "5")),
+    cooldown       = float(os.getenv("SPOON_BREAKER_COOLDOWN", "30")),
+    quota_reserve  = float(os.getenv("SPOON_QUOTA_RESERVE",  "0")),
+    users          = users,
+)
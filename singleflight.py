@@ -0,0 +1,40 @@
+# singleflight.py ─────────────────────────────────────────────────────
+# 同一個 key 同時只打一次上游：後到的呼叫直接等第一個的結果。
+# 午餐尖峰一堆人同時傳「雞腿便當」時，只會花一次 Spoonacular 額度。
+# ----------------------------------------------------------------------
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def inflight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        第一個呼叫者建立 task，其他人共用同一個 task。
+        - 上游丟例外：每個等待者都會收到同一個例外
+        - 某個等待者被 cancel：只有它自己離開，task 照跑給其他人
+        - task 本身被 cancel：每個等待者都收到 CancelledError
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+            self.stats["calls"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()          # 所有人都走了也不要噴 "never retrieved"
@@ -0,0 +1,130 @@
+# suggest.py ──────────────────────────────────────────────────────────
+# 查不到營養時的「你是不是要找…」：只用本機已經有的食物名稱，不碰網路。
+#   - 前綴：trie，打「雞腿」就給「雞腿便當」「雞腿飯」；每個節點直接存好
+#     最短的前幾個名字，查詢只是沿著字走下去
+#   - 打錯字：SymSpell 式的 deletes 索引，每個名字（前 PREFIX_LEN 個字）刪掉
+#     1～2 個字的所有變形都記下來，查詢時把輸入也刪一刪去對，
+#     對到的候選再算一次真的編輯距離；不用跟整張表逐筆比
+# key 一律是 textnorm.norm_name 正規化過的；回傳的是顯示用的名稱。
+# ----------------------------------------------------------------------
+from itertools import combinations
+
+MAX_DISTANCE = 2
+PREFIX_LEN   = 7           # deletes 只對前幾個字做，長名字才不會炸開
+TOP          = 8           # trie 每個節點最多記幾個
+MAX_VERIFY   = 256         # 一次查詢最多算幾個候選的真距離
+
+
+def _deletes_by_level(s: str, d: int) -> list[set[str]]:
+    """[刪 0 個字, 刪 1 個字, …, 刪 d 個字] 各自的所有結果。"""
+    levels = [{s}]
+    for n in range(1, min(d, len(s)) + 1):
+        levels.append({"".join(c for i, c in enumerate(s) if i not in drop)
+                       for drop in combinations(range(len(s)), n)})
+    return levels
+
+
+def _deletes(s: str, d: int) -> set[str]:
+    return set().union(*_deletes_by_level(s, d))
+
+
+def distance(a: str, b: str, limit: int) -> int:
+    """Damerau（相鄰對調算一步）編輯距離；超過 limit 就提早回 limit + 1。"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if prev2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class Suggester:
+    def __init__(self, max_distance: int = MAX_DISTANCE, prefix_len: int = PREFIX_LEN):
+        self.max_distance = max_distance
+        self.prefix_len   = prefix_len
+        self._names: dict[str, str] = {}            # key → 顯示名稱
+        self._trie: dict = {}                       # 字 → 子節點；"" → 這個前綴最短的幾個 key
+        self._deletes: dict[str, list[str]] = {}    # 刪過的變形 → 原本的 key
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._names
+
+    def clear(self):
+        self._names.clear(); self._trie.clear(); self._deletes.clear()
+
+    def add(self, key: str, name: str):
+        """同一個 key 只收第一次（跟 nutrition_db 的索引一樣）。"""
+        if not key or key in self._names:
+            return
+        self._names[key] = name
+
+        node = self._trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+            top = node.setdefault("", [])
+            if len(top) < TOP or len(key) < len(top[-1]):
+                top.append(key)
+                top.sort(key=len)
+                del top[TOP:]
+
+        for v in _deletes(key[:self.prefix_len], self.max_distance):
+            self._deletes.setdefault(v, []).append(key)
+
+    def prefix(self, key: str, k: int) -> list[str]:
+        node = self._trie
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                return []
+        return [c for c in node.get("", ()) if c != key][:k]
+
+    def close(self, key: str, k: int) -> list[tuple[int, str]]:
+        """
+        編輯距離內的 key，(距離, key) 由近到遠。短的輸入只容許錯一個字。
+        距離 n 的一定在輸入刪 ≤ n 個字時就對得到，所以照刪幾個字一層一層找，
+        距離 ≤ 這層的已經湊滿 k 個就不用往下；名字很密的時候最多驗 MAX_VERIFY 個。
+        """
+        d = 1 if len(key) <= 2 else self.max_distance
+        seen, out, verified = {key}, [], 0
+        for level, variants in enumerate(_deletes_by_level(key[:self.prefix_len], d)):
+            for v in variants:
+                for cand in self._deletes.get(v, ()):
+                    if cand in seen or verified >= MAX_VERIFY:
+                        continue
+                    seen.add(cand)
+                    verified += 1
+                    if (dist := distance(key, cand, d)) <= d:
+                        out.append((dist, cand))
+            if sum(1 for dist, _ in out if dist <= level) >= k or verified >= MAX_VERIFY:
+                break
+        out.sort(key=lambda t: (t[0], abs(len(t[1]) - len(key)), t[1]))
+        return out[:k]
+
+    def suggest(self, key: str, k: int = 4) -> list[str]:
+        """
+        接著打完的（前綴）> 錯一個字的 > 錯兩個字的；回顯示名稱，不含 key 本身。
+        「雞腿」先給「雞腿飯」「雞腿便當」，才輪到「雞排」。
+        """
+        if not key:
+            return []
+        near = self.close(key, k)
+        ranked = self.prefix(key, k)
+        ranked += [c for d, c in near if d <= 1]
+        ranked += [c for d, c in near if d > 1]
+        out, seen = [], set()
+        for c in ranked:
+            name = self._names[c]
+            if name not in seen:
+                seen.add(name)
+                out.append(name)
+        return out[:k]
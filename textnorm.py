@@ -0,0 +1,50 @@
+# textnorm.py ─────────────────────────────────────────────────────────
+# 食物名稱正規化：給快取 / 索引當 key 用，不拿來顯示。
+#   1) NFKC：全形 → 半形、相容字（㎏、①…）攤平
+#   2) casefold：英文不分大小寫
+#   3) 繁 → 簡：有裝 opencc 就用它，沒有就用下面的常用字表
+#   4) 去掉標點、空白、符號，只留文字與數字
+# ----------------------------------------------------------------------
+import re, unicodedata
+from functools import lru_cache
+
+# ── 繁簡對照（opencc 不在時的後備，只收食物 / 點餐常見字）────────────
+# 每組兩個字：繁在前、簡在後
+_T2S_PAIRS = """
+雞鸡 鴨鸭 鵝鹅 豬猪 魚鱼 蝦虾 蠔蚝 貝贝 鮭鲑 鮪鲔 鱈鳕 鰻鳗 鯛鲷 魷鱿 鱔鳝
+鰱鲢 鯉鲤 鯽鲫 鱸鲈 賊贼 蝸蜗 鴿鸽 鵪鹌 鶉鹑 驢驴 蠣蛎 當当 飯饭 麵面 麪面
+麥麦 餅饼 餃饺 湯汤 滷卤 鹵卤 燒烧 熱热 涼凉 凍冻 蘿萝 蔔卜 蔥葱 薑姜 筍笋
+蘋苹 葉叶 檸柠 龍龙 鳳凤 棗枣 櫻樱 藍蓝 鬆松 糰团 團团 圓圆 餛馄 飩饨 捲卷
+壽寿 蘭兰 韓韩 國国 義义 漢汉 雜杂 糧粮 穀谷 豐丰 條条 塊块 絲丝 醬酱 鹹咸
+鍋锅 爐炉 盤盘 點点 雙双 紅红 綠绿 烏乌 燉炖 燙烫 蓮莲 麩麸 黃黄 漿浆 腸肠
+臘腊 廣广 東东 臺台 灣湾 號号 種种 樣样 個个 頭头 乾干 濕湿 餡馅 濃浓 鮮鲜
+軟软 綿绵 籠笼 薺荠 莧苋 萵莴 蘆芦 銀银 餌饵 漬渍 醃腌 燻熏 鹽盐 麗丽 蘇苏
+饅馒 紮扎 夾夹 層层 廚厨 綜综 總总 滿满 優优 維维 鈉钠 鈣钙 鐵铁 纖纤 養养
+營营 質质 飲饮 館馆 廳厅 單单 價价 買买 賣卖 蕎荞 飽饱 餘余 雲云 裡里 裏里
+後后 發发 髮发 會会 過过 來来 對对 無无 時时 實实 長长 車车 風风 電电 獅狮
+燴烩 煉炼 蠶蚕 菓果 粵粤 閩闽 塩盐 鯖鲭 鰹鲣 鱉鳖 鳥鸟 麼么 這这 們们 還还
+幾几 夠够 嗎吗 與与 為为 開开 關关 門门 話话 請请 謝谢 讓让 錢钱 貴贵 極极
+線线 級级 樂乐 爾尔 劑剂 藥药 鐘钟
+"""
+_T2S = {ord(p[0]): p[1] for p in _T2S_PAIRS.split()}
+
+try:                                    # 有裝就用完整的 OpenCC 表
+    from opencc import OpenCC
+    _cc = OpenCC("t2s")
+    _to_simplified = _cc.convert
+except ImportError:                     # 沒裝就用上面的常用字表
+    _to_simplified = lambda s: s.translate(_T2S)
+
+# \W 已經涵蓋 Unicode 標點、符號、空白；底線另外去掉
+_STRIP = re.compile(r"[\W_]+")
+
+
+@lru_cache(maxsize=65536)
+def norm_name(s: str) -> str:
+    """
+    「珍珠奶茶」「珍珠 奶茶！」「ＰＥＡＲＬ　ＭＩＬＫ　ＴＥＡ」都會變成同一個 key。
+    全部都是標點 / 空白時回空字串，呼叫端要自己擋掉。
+    """
+    s = unicodedata.normalize("NFKC", str(s)).casefold()
+    s = _to_simplified(s)
+    return _STRIP.sub("", s)
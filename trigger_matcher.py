@@ -0,0 +1,115 @@
+# trigger_matcher.py ──────────────────────────────────────────────────
+# 把 chat.TRIGGERS 這種「正則 → 回覆」表編譯成一次比對：
+#   - 純文字關鍵字（謝謝、早安…）→ Aho-Corasick，訊息掃一遍就找出全部命中
+#   - 真正的正則 → 合成一條 alternation，照順序排，第一個成立的就是優先的
+# 兩邊各取「順位最前面」的命中，再取較前者，結果跟逐條 re.search 一樣。
+# 合不進 alternation 的正則（具名群組、反向參照、整條生效的 (?i) 這類旗標）
+# 就各自編譯、逐條 re.search；合起來編譯還是失敗就全部改逐條。
+# ----------------------------------------------------------------------
+import re
+
+_META = set("()[]{}?*+|^$\\.")
+# 合進一條大正則會出事的寫法：群組名字撞到 / 編號跑掉、全域旗標只能放最前面
+_UNSAFE = re.compile(r"\(\?P[<=]|\(\?<[^=!]|\\[1-9]|\\g<|\(\?[aiLmsux]+\)")
+
+
+def _is_literal(pattern: str) -> bool:
+    return not any(c in _META for c in pattern)
+
+
+class _AhoCorasick:
+    """關鍵字自動機；每個節點只記「經過這裡能命中的最小順位」。"""
+
+    def __init__(self, words: list[tuple[str, int]]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.best: list[int | None] = [None]
+        for word, prio in words:
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({}); self.fail.append(0); self.best.append(None)
+                node = nxt
+            if self.best[node] is None or prio < self.best[node]:
+                self.best[node] = prio
+
+        # BFS 建 fail link（第一層固定指回 root），順便把 fail 鏈上的最小順位往下傳
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, nxt in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                fb = self.best[self.fail[nxt]]
+                if fb is not None and (self.best[nxt] is None or fb < self.best[nxt]):
+                    self.best[nxt] = fb
+                queue.append(nxt)
+
+    def search(self, text: str) -> int | None:
+        goto, fail, best = self.goto, self.fail, self.best
+        node, found = 0, None
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            b = best[node]
+            if b is not None and (found is None or b < found):
+                found = b
+                if found == 0:
+                    break
+        return found
+
+
+class TriggerMatcher:
+    def __init__(self, table: list[tuple[str, str]]):
+        self.replies: list[str] = []
+        literals: list[tuple[str, int]] = []
+        alts:     list[str] = []
+        compiled: list[tuple[int, re.Pattern]] = []
+        self._singles: list[tuple[int, re.Pattern]] = []   # 逐條 search，照順位排
+        for pattern, reply in table:
+            try:
+                rx = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                print("[triggers] 略過壞掉的規則", repr(pattern), e)
+                continue
+            prio = len(self.replies)
+            self.replies.append(reply)
+            compiled.append((prio, rx))
+            if _is_literal(pattern):
+                literals.append((pattern.lower(), prio))
+            elif _UNSAFE.search(pattern):
+                self._singles.append((prio, rx))
+            else:
+                # 每條包成 lookahead，從開頭試；alternation 照順序試，所以先成立的就是最優先
+                alts.append(rf"(?=[\s\S]*?(?:{pattern}))(?P<t{prio}>)")
+
+        self._ac = _AhoCorasick(literals) if literals else None
+        try:
+            self._re = re.compile("|".join(alts), re.IGNORECASE) if alts else None
+        except re.error as e:                # 保險：合不起來就全部逐條比
+            print("[triggers] 規則合併失敗，改逐條比對：", e)
+            self._re = None
+            self._singles = [(p, rx) for p, rx in compiled if not _is_literal(rx.pattern)]
+
+    def __len__(self):
+        return len(self.replies)
+
+    def match(self, text: str) -> str | None:
+        """text 要先轉小寫（跟 chat.try_reply 一樣）。"""
+        best = self._ac.search(text) if self._ac else None
+        if self._re and (m := self._re.match(text)):
+            prio = int(m.lastgroup[1:])
+            if best is None or prio < best:
+                best = prio
+        for prio, rx in self._singles:
+            if best is not None and prio >= best:
+                break
+            if rx.search(text):
+                best = prio
+                break
+        return None if best is None else self.replies[best]